@@ -0,0 +1,221 @@
+""" Вычислительные реализации расчета сил и интегрирования.
+
+Доступны три реализации, выбираемые при создании ParticleConfiguration:
+    "numpy"  - векторизованные массивы NumPy;
+    "python" - эталонный поэлементный расчет;
+    "numba"  - JIT-компилированные ядра, если установлен numba.
+"auto" выбирает "numba" при его наличии и "numpy" в противном случае.
+"""
+from kernels import *
+from potential_table import pair_interactions_table, pair_interactions_table_scalar
+import os
+
+# Скомпилированные ядра сохраняются на диск, чтобы повторные запуски
+# (в том числе на вычислительных узлах) не тратили время на компиляцию
+os.environ.setdefault("NUMBA_CACHE_DIR",
+                      os.path.join(os.path.expanduser("~"), ".cache", "molecular_dynamics", "numba"))
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+class NumpyBackend:
+    """ Векторизованный расчет средствами NumPy """
+    name = "numpy"
+
+    def all_pair_interactions(self, positions, a, r0, e, r1, r2, box=0., table=None):
+        pairs_i, pairs_j = upper_triangle_pairs(len(positions))
+        return self.pair_interactions(positions, pairs_i, pairs_j, a, r0, e, r1, r2, box, table)
+
+    def pair_interactions(self, positions, pairs_i, pairs_j, a, r0, e, r1, r2, box=0., table=None):
+        """ Расчет по списку пар; при заданной table - по табличному потенциалу """
+        if table is not None:
+            return pair_interactions_table(positions, pairs_i, pairs_j, table, box)
+        return pair_interactions_list(positions, pairs_i, pairs_j, a, r0, e, r1, r2, box)
+
+    def update_positions(self, positions, velocities, forces, masses, time_step):
+        update_positions(positions, velocities, forces, masses, time_step)
+
+    def update_velocities(self, velocities, forces, forces_prev, masses, time_step):
+        update_velocities(velocities, forces, forces_prev, masses, time_step)
+
+
+class PythonBackend(NumpyBackend):
+    """ Эталонный поэлементный расчет """
+    name = "python"
+
+    def pair_interactions(self, positions, pairs_i, pairs_j, a, r0, e, r1, r2, box=0., table=None):
+        if table is not None:
+            return pair_interactions_table_scalar(positions, pairs_i, pairs_j, table, box)
+        return pair_interactions_list_scalar(positions, pairs_i, pairs_j, a, r0, e, r1, r2, box)
+
+    def update_positions(self, positions, velocities, forces, masses, time_step):
+        update_positions_scalar(positions, velocities, forces, masses, time_step)
+
+    def update_velocities(self, velocities, forces, forces_prev, masses, time_step):
+        update_velocities_scalar(velocities, forces, forces_prev, masses, time_step)
+
+
+if numba is not None:
+    @numba.njit(cache=True, nogil=True, error_model="numpy")
+    def _pair_interaction_numba(dx, dy, sigma_6, r0_6, e, r1, r2):
+        """ Потенциал пары и отношение силы к смещению """
+        rij_2 = dx * dx + dy * dy
+        if rij_2 >= r2 * r2:
+            return 0., 0.
+        distance = math.sqrt(rij_2)
+        if distance <= r1:
+            K = 1.
+        else:
+            buffer = ((distance - r1) / (r1 - r2)) ** 2
+            K = (1 - buffer) ** 2
+        rij_6 = rij_2 * rij_2 * rij_2
+        buffer = sigma_6 / rij_6
+        potential = 4 * e * (buffer * buffer - buffer) * K
+        ratio = 12 * e * r0_6 * (r0_6 / rij_6 - 1) / (rij_6 * rij_2) * K
+        return potential, ratio
+
+    @numba.njit(cache=True, nogil=True, error_model="numpy")
+    def _pairs_numba(positions, pairs_i, pairs_j, a, r0, e, r1, r2, box, forces, potentials):
+        sigma_6 = (a / 2 ** (1 / 6.)) ** 6
+        r0_6 = r0 ** 6
+        total = 0.
+        for k in range(len(pairs_i)):
+            i = pairs_i[k]
+            j = pairs_j[k]
+            dx = positions[i, 0] - positions[j, 0]
+            dy = positions[i, 1] - positions[j, 1]
+            if box > 0:
+                dx -= box * np.rint(dx / box)
+                dy -= box * np.rint(dy / box)
+            potential, ratio = _pair_interaction_numba(dx, dy, sigma_6, r0_6, e, r1, r2)
+            forces[i, 0] += ratio * dx
+            forces[i, 1] += ratio * dy
+            forces[j, 0] -= ratio * dx
+            forces[j, 1] -= ratio * dy
+            potentials[i] += potential
+            potentials[j] += potential
+            total += potential
+        return total
+
+    @numba.njit(cache=True, nogil=True, error_model="numpy")
+    def _pairs_table_numba(positions, pairs_i, pairs_j, a, r0, e, r1, r2, box,
+                           r2_min, inverse_step, table_potential, potential_slope,
+                           table_ratio, ratio_slope, forces, potentials):
+        sigma_6 = (a / 2 ** (1 / 6.)) ** 6
+        r0_6 = r0 ** 6
+        last = len(table_potential) - 1
+        total = 0.
+        for k in range(len(pairs_i)):
+            i = pairs_i[k]
+            j = pairs_j[k]
+            dx = positions[i, 0] - positions[j, 0]
+            dy = positions[i, 1] - positions[j, 1]
+            if box > 0:
+                dx -= box * np.rint(dx / box)
+                dy -= box * np.rint(dy / box)
+            rij_2 = dx * dx + dy * dy
+            if rij_2 < r2_min:
+                potential, ratio = _pair_interaction_numba(dx, dy, sigma_6, r0_6, e, r1, r2)
+            else:
+                position = (rij_2 - r2_min) * inverse_step
+                index = min(int(position), last)
+                fraction = position - index
+                potential = table_potential[index] + fraction * potential_slope[index]
+                ratio = table_ratio[index] + fraction * ratio_slope[index]
+            forces[i, 0] += ratio * dx
+            forces[i, 1] += ratio * dy
+            forces[j, 0] -= ratio * dx
+            forces[j, 1] -= ratio * dy
+            potentials[i] += potential
+            potentials[j] += potential
+            total += potential
+        return total
+
+    @numba.njit(cache=True, nogil=True, error_model="numpy")
+    def _all_pairs_numba(positions, a, r0, e, r1, r2, box, forces, potentials):
+        sigma_6 = (a / 2 ** (1 / 6.)) ** 6
+        r0_6 = r0 ** 6
+        total = 0.
+        particles_count = positions.shape[0]
+        for i in range(particles_count):
+            for j in range(i + 1, particles_count):
+                dx = positions[i, 0] - positions[j, 0]
+                dy = positions[i, 1] - positions[j, 1]
+                if box > 0:
+                    dx -= box * np.rint(dx / box)
+                    dy -= box * np.rint(dy / box)
+                potential, ratio = _pair_interaction_numba(dx, dy, sigma_6, r0_6, e, r1, r2)
+                forces[i, 0] += ratio * dx
+                forces[i, 1] += ratio * dy
+                forces[j, 0] -= ratio * dx
+                forces[j, 1] -= ratio * dy
+                potentials[i] += potential
+                potentials[j] += potential
+                total += potential
+        return total
+
+    @numba.njit(cache=True, nogil=True, error_model="numpy")
+    def _update_positions_numba(positions, velocities, forces, masses, time_step):
+        for i in range(positions.shape[0]):
+            ratio = time_step ** 2 / (2 * masses[i])
+            for axis in range(2):
+                positions[i, axis] += velocities[i, axis] * time_step + forces[i, axis] * ratio
+
+    @numba.njit(cache=True, nogil=True, error_model="numpy")
+    def _update_velocities_numba(velocities, forces, forces_prev, masses, time_step):
+        for i in range(velocities.shape[0]):
+            ratio = time_step / (2. * masses[i])
+            for axis in range(2):
+                velocities[i, axis] += (forces[i, axis] + forces_prev[i, axis]) * ratio
+
+
+class NumbaBackend(NumpyBackend):
+    """ JIT-компилированный расчет без промежуточных массивов """
+    name = "numba"
+
+    def all_pair_interactions(self, positions, a, r0, e, r1, r2, box=0., table=None):
+        if table is not None:
+            return NumpyBackend.all_pair_interactions(self, positions, a, r0, e, r1, r2, box, table)
+        forces = np.zeros((len(positions), 2))
+        potentials = np.zeros(len(positions))
+        total = _all_pairs_numba(positions, a, r0, e, r1, r2, float(box), forces, potentials)
+        return forces, potentials, total
+
+    def pair_interactions(self, positions, pairs_i, pairs_j, a, r0, e, r1, r2, box=0., table=None):
+        forces = np.zeros((len(positions), 2))
+        potentials = np.zeros(len(positions))
+        if table is not None:
+            total = _pairs_table_numba(positions, pairs_i, pairs_j, a, r0, e, r1, r2, float(box),
+                                       table.r2_min, table.inverse_step, table.potential,
+                                       table.potential_slope, table.ratio, table.ratio_slope,
+                                       forces, potentials)
+        else:
+            total = _pairs_numba(positions, pairs_i, pairs_j, a, r0, e, r1, r2, float(box),
+                                 forces, potentials)
+        return forces, potentials, total
+
+    def update_positions(self, positions, velocities, forces, masses, time_step):
+        _update_positions_numba(positions, velocities, forces, masses, time_step)
+
+    def update_velocities(self, velocities, forces, forces_prev, masses, time_step):
+        _update_velocities_numba(velocities, forces, forces_prev, masses, time_step)
+
+
+BACKENDS = {
+    "numpy": NumpyBackend,
+    "python": PythonBackend,
+}
+if numba is not None:
+    BACKENDS["numba"] = NumbaBackend
+
+
+def get_backend(name="auto"):
+    """ Вычислительная реализация по имени """
+    if name == "auto":
+        name = "numba" if numba is not None else "numpy"
+    if name not in BACKENDS:
+        raise ValueError("Недоступная вычислительная реализация: %s" % name)
+    return BACKENDS[name]()
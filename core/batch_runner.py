@@ -0,0 +1,188 @@
+""" Запуск моделирования без графического интерфейса.
+
+Пример:
+    python batch_runner.py --particles 100 --b 1.1 --steps 5000 --output run.csv
+    python batch_runner.py --config run.json
+"""
+from global_variables import *
+from checkpoint import CheckpointWriter, load_checkpoint
+from observables_log import ObservablesLogger, truncate_observables
+from trajectory import TrajectoryWriter
+import argparse
+import json
+import csv
+import sys
+import os
+
+
+# Число шагов, рассчитываемых одним вызовом advance
+CHUNK_STEPS = 1000
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(description="Моделирование капли без GUI")
+    parser.add_argument("--config", help="JSON-файл с параметрами (ключи совпадают с аргументами)")
+    parser.add_argument("--particles", type=int, default=100, help="Число частиц")
+    parser.add_argument("--a", type=float, default=PARTICLE_DIAMETER, help="Параметр a, м")
+    parser.add_argument("--b", type=float, default=1.0, help="Период решетки в единицах a")
+    parser.add_argument("--time-step", type=float, default=0.01 * TAO, help="Шаг по времени, с")
+    parser.add_argument("--integrator", default="verlet", choices=("verlet", "adaptive"),
+                        help="Интегрирование: verlet - постоянный шаг, adaptive - адаптивный шаг")
+    parser.add_argument("--time-step-min", type=float, default=None, help="Наименьший адаптивный шаг, с")
+    parser.add_argument("--time-step-max", type=float, default=None, help="Наибольший адаптивный шаг, с")
+    parser.add_argument("--energy-tolerance", type=float, default=ADAPTIVE_ENERGY_TOLERANCE,
+                        help="Допустимое изменение энергии за адаптивный шаг, D на частицу")
+    parser.add_argument("--steps", type=int, default=STEPS, help="Число шагов моделирования")
+    parser.add_argument("--sample-every", type=int, default=1, help="Интервал записи наблюдаемых")
+    parser.add_argument("--cell-length", type=float, default=L_CELL, help="Размер расчетной ячейки, м")
+    parser.add_argument("--lattice", default="square", choices=LATTICES,
+                        help="Начальная решетка капли: square - квадратная, hexagonal - гексагональная")
+    parser.add_argument("--boundary", default="open", choices=("open", "periodic"),
+                        help="Граница ячейки: open - испарение, periodic - периодические условия")
+    parser.add_argument("--potential", default="analytic", choices=("analytic", "table"),
+                        help="Расчет потенциала: analytic - точная формула, table - интерполяция по таблице")
+    parser.add_argument("--table-points", type=int, default=TABLE_POINTS, help="Число узлов таблицы потенциала")
+    parser.add_argument("--rand-coords", action="store_true", help="Случайные отклонения координат")
+    parser.add_argument("--rand-speeds", action="store_true", help="Случайные начальные скорости")
+    parser.add_argument("--system-temp", type=float, default=None,
+                        help="Начальные скорости по заданной температуре, K")
+    parser.add_argument("--seed", type=int, default=None, help="Начальное значение генератора случайных чисел")
+    parser.add_argument("--backend", default="auto", help="Вычислительная реализация: numpy, python, numba, auto")
+    parser.add_argument("--workers", type=int, default=1, help="Число потоков для расчета сил")
+    parser.add_argument("--output", default="observables.csv",
+                        help="Файл наблюдаемых величин (.csv или .parquet)")
+    parser.add_argument("--evaporation", default=None,
+                        help="CSV-файл испарившихся частиц (шаг, идентификатор, координаты, скорость)")
+    parser.add_argument("--trajectory", default=None, help="Двоичный файл траектории")
+    parser.add_argument("--trajectory-every", type=int, default=100, help="Интервал записи траектории")
+    parser.add_argument("--checkpoint", default=None, help="Файл контрольной точки")
+    parser.add_argument("--checkpoint-every", type=int, default=1000, help="Интервал записи контрольной точки")
+    parser.add_argument("--resume", action="store_true", help="Продолжить расчет из контрольной точки")
+    return parser
+
+
+def parse_arguments(argv=None):
+    """ Разбор аргументов с учетом файла конфигурации """
+    parser = create_parser()
+    args, _ = parser.parse_known_args(argv)
+    if args.config:
+        with open(args.config) as f:
+            config = json.load(f)
+        parser.set_defaults(**{key.replace("-", "_"): value for key, value in config.items()})
+    args = parser.parse_args(argv)
+    if args.resume and args.output.endswith(".parquet"):
+        parser.error("продолжение расчета (--resume) не поддерживается для вывода в parquet: "
+                     "укажите файл .csv")
+    return args
+
+
+def create_configuration(args):
+    """ Создание конфигурации частиц по аргументам запуска """
+    return ParticleConfiguration(args.particles,
+                                 args.a,
+                                 args.b * args.a,
+                                 args.time_step,
+                                 is_coords_rand=args.rand_coords,
+                                 is_speeds_rand=args.rand_speeds,
+                                 is_research_speed=args.system_temp is not None,
+                                 system_temp=args.system_temp or 0,
+                                 cell_length=args.cell_length,
+                                 boundary=args.boundary,
+                                 lattice=args.lattice,
+                                 potential=args.potential,
+                                 table_points=args.table_points,
+                                 integrator=args.integrator,
+                                 time_step_min=args.time_step_min,
+                                 time_step_max=args.time_step_max,
+                                 energy_tolerance=args.energy_tolerance,
+                                 seed=args.seed,
+                                 backend=args.backend,
+                                 workers=args.workers)
+
+
+def run_parameters(args):
+    """ Параметры запуска, записываемые вместе с наблюдаемыми """
+    return {"particles_quantity": args.particles,
+            "a": args.a,
+            "b": args.b,
+            "time_step": args.time_step,
+            "boundary": args.boundary,
+            "lattice": args.lattice,
+            "integrator": args.integrator,
+            "seed": args.seed}
+
+
+def write_evaporation(path, config):
+    """ Запись журнала испарившихся частиц """
+    records = config.evaporated
+    positions = records.column("positions")
+    velocities = records.column("velocities")
+    with open(path, mode="w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(("step", "time", "id", "x", "y", "vx", "vy"))
+        writer.writerows(zip(records.column("step").tolist(), records.column("time").tolist(),
+                             records.column("ids").tolist(),
+                             positions[:, 0].tolist(), positions[:, 1].tolist(),
+                             velocities[:, 0].tolist(), velocities[:, 1].tolist()))
+
+
+def run(args):
+    """ Расчет args.steps шагов с записью наблюдаемых величин """
+    is_resumed = args.resume and args.checkpoint and os.path.exists(args.checkpoint)
+    if is_resumed:
+        config, _ = load_checkpoint(args.checkpoint)
+        truncate_observables(args.output, config.step_count)
+    else:
+        config = create_configuration(args)
+
+    trajectory = None
+    if args.trajectory:
+        # При продолжении расчета кадры дописываются в существующую траекторию
+        trajectory = TrajectoryWriter(args.trajectory, config, args.trajectory_every, append=is_resumed)
+        if trajectory.is_new:
+            trajectory.write(config)
+
+    checkpoints = None
+    if args.checkpoint:
+        checkpoints = CheckpointWriter(args.checkpoint, args.checkpoint_every)
+
+    # При продолжении расчета наблюдаемые дописываются в существующий файл
+    with ObservablesLogger(args.output, ObservableSamples.COLUMNS, run_parameters(args),
+                           append=is_resumed) as logger:
+        while config.step_count < args.steps and len(config.configuration) > 0:
+            chunk = min(CHUNK_STEPS, args.steps - config.step_count)
+            # Блок заканчивается на ближайшем кадре траектории или контрольной точке
+            for writer_object in (trajectory, checkpoints):
+                if writer_object is not None:
+                    every = writer_object.every
+                    chunk = min(chunk, every - config.step_count % every)
+            samples = config.advance(chunk, args.sample_every)
+            logger.log_columns(**{column: getattr(samples, column) for column in samples.COLUMNS})
+            if trajectory is not None:
+                trajectory.maybe_write(config)
+            if checkpoints is not None and config.step_count % checkpoints.every == 0:
+                # Все строки до контрольной точки должны быть на диске
+                logger.sync()
+                checkpoints.save(config)
+
+        if checkpoints is not None:
+            logger.sync()
+            checkpoints.save(config)
+            checkpoints.close()
+
+    if trajectory is not None:
+        trajectory.close()
+    if args.evaporation:
+        write_evaporation(args.evaporation, config)
+    return config
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    config = run(args)
+    print("[+] Расчет завершен. Осталось частиц: %s из %s" % (len(config.configuration), args.particles),
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
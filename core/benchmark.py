@@ -0,0 +1,197 @@
+""" Замеры производительности расчетного ядра без графического интерфейса.
+
+Для каждого сочетания числа частиц, параметра решетки b и вычислительной
+реализации замеряется время расчета сил, шага алгоритма Верле, наблюдаемых
+величин и полного шага по времени. Каждый замер начинается с копии одной
+и той же исходной конфигурации. Результаты сохраняются в JSON и могут
+сравниваться с ранее сохраненными для обнаружения замедлений.
+
+Пример:
+    python benchmark.py --save baseline.json
+    python benchmark.py --compare baseline.json --tolerance 0.2
+"""
+from global_variables import *
+from checkpoint import dumps_checkpoint, loads_checkpoint
+import argparse
+import platform
+import json
+import time
+import sys
+
+
+# Замеряемые функции ParticleConfiguration
+BENCHMARK_FUNCTIONS = ("calculate_forces",
+                       "calculate_verle",
+                       "calculate_observables",
+                       "calculate_next_time_step")
+
+# Наибольшее число вызовов подряд без восстановления исходного состояния
+MAX_BATCH_CALLS = 100
+
+DEFAULT_PARTICLES = "4,16,100,400,1600,10000"
+DEFAULT_B_VALUES = "0.90,1.00,1.10,1.20,1.30,1.40,1.50"
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(description="Замеры производительности моделирования")
+    parser.add_argument("--particles", default=DEFAULT_PARTICLES,
+                        help="Числа частиц через запятую")
+    parser.add_argument("--b", default=DEFAULT_B_VALUES, help="Периоды решетки в единицах a через запятую")
+    parser.add_argument("--backend", default="auto", help="Вычислительные реализации через запятую")
+    parser.add_argument("--boundary", default="open", choices=("open", "periodic"),
+                        help="Граница ячейки: open - с испарением, periodic - постоянное число частиц")
+    parser.add_argument("--min-time", type=float, default=0.05,
+                        help="Наименьшая длительность одного замера, с")
+    parser.add_argument("--repeat", type=int, default=3, help="Число замеров; используется лучший")
+    parser.add_argument("--save", default=None, help="JSON-файл для сохранения результатов")
+    parser.add_argument("--compare", default=None, help="JSON-файл базовых результатов для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Допустимое относительное замедление по сравнению с базовыми результатами")
+    return parser
+
+
+def benchmark_cell_length(particles_quantity, b):
+    """ Размер ячейки, вмещающий решетку с запасом для расширения капли """
+    side = math.ceil(math.sqrt(particles_quantity))
+    return max(L_CELL, 3 * side * b)
+
+
+def create_configuration(particles_quantity, b_ratio, backend, boundary="open"):
+    b = b_ratio * PARTICLE_DIAMETER
+    return ParticleConfiguration(particles_quantity,
+                                 PARTICLE_DIAMETER,
+                                 b,
+                                 0.01 * TAO,
+                                 cell_length=benchmark_cell_length(particles_quantity, b),
+                                 backend=backend,
+                                 boundary=boundary,
+                                 seed=0)
+
+
+def time_function(create_function, min_time, repeat):
+    """ Наименьшее среднее время вызова по repeat замерам.
+        create_function() возвращает вызываемую функцию для исходного состояния.
+        Число вызовов в замере подбирается так,
+        чтобы замер длился не меньше min_time """
+    def measure(calls):
+        # Состояние восстанавливается каждые MAX_BATCH_CALLS вызовов, чтобы
+        # капля не успевала заметно измениться; восстановление не замеряется
+        elapsed = 0.
+        for first in range(0, calls, MAX_BATCH_CALLS):
+            function = create_function()
+            start = time.perf_counter()
+            for _ in range(min(MAX_BATCH_CALLS, calls - first)):
+                function()
+            elapsed += time.perf_counter() - start
+        return elapsed
+
+    measure(1)
+    calls = 1
+    while True:
+        elapsed = measure(calls)
+        if elapsed >= min_time:
+            break
+        calls = max(calls * 2, int(calls * min_time / max(elapsed, 1e-9)))
+
+    best = elapsed / calls
+    for _ in range(repeat - 1):
+        best = min(best, measure(calls) / calls)
+    return best
+
+
+def run_benchmark(particles_values, b_values, backends, min_time=0.05, repeat=3, progress=None,
+                  boundary="open"):
+    """ Результаты замеров: список словарей, по одному на функцию и сочетание параметров """
+    results = []
+    for backend in backends:
+        for particles_quantity in particles_values:
+            for b_ratio in b_values:
+                config = create_configuration(particles_quantity, b_ratio, backend, boundary)
+                # Частицы испаряются, поэтому замеры начинаются с копии исходного состояния
+                snapshot = dumps_checkpoint(config)
+                particles_count = max(1, len(config.store))
+                for name in BENCHMARK_FUNCTIONS:
+                    def create_function():
+                        return getattr(loads_checkpoint(snapshot)[0], name)
+                    seconds = time_function(create_function, min_time, repeat)
+                    result = {"backend": config.backend.name,
+                              "boundary": boundary,
+                              "particles": particles_quantity,
+                              "b": b_ratio,
+                              "function": name,
+                              "seconds": seconds,
+                              "steps_per_second": 1. / seconds,
+                              "ns_per_particle_step": seconds * 1e9 / particles_count}
+                    results.append(result)
+                    if progress is not None:
+                        progress(result)
+    return results
+
+
+def result_key(result):
+    return (result["backend"], result.get("boundary", "open"), result["particles"],
+            round(result["b"], 6), result["function"])
+
+
+def compare_results(results, baseline, tolerance):
+    """ Замедлившиеся замеры: (результат, базовый результат) """
+    baseline_results = {result_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        reference = baseline_results.get(result_key(result))
+        if reference is not None and result["seconds"] > reference["seconds"] * (1 + tolerance):
+            regressions.append((result, reference))
+    return regressions
+
+
+def environment_info():
+    """ Сведения о среде запуска, сохраняемые вместе с результатами """
+    return {"python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "backends": sorted(BACKENDS),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def print_result(result):
+    print("%-6s N=%-6s b=%.2f %-26s %12.1f шаг/с %10.1f нс/частица/шаг" %
+          (result["backend"], result["particles"], result["b"], result["function"],
+           result["steps_per_second"], result["ns_per_particle_step"]))
+    sys.stdout.flush()
+
+
+def parse_list(text, value_type):
+    return [value_type(value) for value in text.split(",") if value.strip()]
+
+
+def main(argv=None):
+    args = create_parser().parse_args(argv)
+    results = run_benchmark(parse_list(args.particles, int),
+                            parse_list(args.b, float),
+                            parse_list(args.backend, str),
+                            args.min_time,
+                            args.repeat,
+                            progress=print_result,
+                            boundary=args.boundary)
+
+    if args.save:
+        with open(args.save, mode="w") as f:
+            json.dump({"environment": environment_info(), "results": results}, f, indent=2)
+        print("[+] Результаты сохранены:", args.save)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.tolerance)
+        for result, reference in regressions:
+            print("[-] Замедление: %s N=%s b=%.2f %s: %.3g с вместо %.3g с" %
+                  (result["backend"], result["particles"], result["b"], result["function"],
+                   result["seconds"], reference["seconds"]))
+        if regressions:
+            sys.exit(1)
+        print("[+] Замедлений относительно базовых результатов нет")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+""" Контрольные точки для продолжения расчета после остановки процесса.
+
+Контрольная точка содержит полное состояние ParticleConfiguration
+(массивы частиц, счетчик шагов, состояние генератора случайных чисел,
+списки соседей) и произвольный словарь состояния вызывающего кода
+(например, накопленные средние). Продолжение расчета из контрольной
+точки дает тот же результат, что и расчет без остановки.
+
+Формат основан на pickle, поэтому загружать следует только собственные файлы.
+"""
+import threading
+import pickle
+import os
+
+
+CHECKPOINT_MAGIC = b"MDCHKPT1"
+
+
+def dumps_checkpoint(config, extra=None):
+    """ Сериализация состояния в байты """
+    payload = {"config": config, "extra": extra or {}}
+    return CHECKPOINT_MAGIC + pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def write_checkpoint_bytes(path, data):
+    """ Атомарная запись: файл заменяется только после полной записи """
+    temp_path = path + ".tmp"
+    with open(temp_path, mode="wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def save_checkpoint(path, config, extra=None):
+    write_checkpoint_bytes(path, dumps_checkpoint(config, extra))
+
+
+def load_checkpoint(path):
+    """ Загрузка контрольной точки: (конфигурация, словарь состояния) """
+    with open(path, mode="rb") as f:
+        data = f.read()
+    if not data.startswith(CHECKPOINT_MAGIC):
+        raise ValueError("Файл не является контрольной точкой: %s" % path)
+    return loads_checkpoint(data)
+
+
+def loads_checkpoint(data):
+    """ Восстановление состояния из байтов dumps_checkpoint """
+    payload = pickle.loads(data[len(CHECKPOINT_MAGIC):])
+    return payload["config"], payload["extra"]
+
+
+class CheckpointWriter:
+    """ Периодическая запись контрольных точек в фоновом потоке.
+        Состояние копируется в памяти, запись на диск не задерживает расчет """
+    def __init__(self, path, every):
+        self.path = path
+        self.every = every
+        self.thread = None
+        self.saved_count = 0
+
+    def save(self, config, extra=None):
+        data = dumps_checkpoint(config, extra)
+        # Предыдущая запись должна завершиться, чтобы файлы не перемешались
+        self.wait()
+        self.thread = threading.Thread(target=write_checkpoint_bytes, args=(self.path, data))
+        self.thread.start()
+        self.saved_count += 1
+
+    def maybe_save(self, config, extra=None):
+        """ Запись, если номер шага кратен every """
+        if config.step_count % self.every == 0:
+            self.save(config, extra)
+
+    def wait(self):
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def close(self):
+        self.wait()
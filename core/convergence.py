@@ -0,0 +1,140 @@
+""" Определение равновесия и сходимости средних в экспериментах.
+
+Начало равновесного участка ряда (температуры, энергии) выбирается так,
+чтобы после отбрасывания начальных точек оставалось наибольшее число
+эффективно независимых значений. Статистическая неэффективность
+(во сколько раз коррелированные значения уступают независимым)
+оценивается методом блочного усреднения. Эксперимент считается
+сошедшимся, когда стандартная ошибка средней температуры равновесного
+участка и разность средних его половин не превышают заданной доли
+средней, а число испарившихся частиц не меняется на второй половине
+равновесного участка.
+
+Пример:
+    monitor = ConvergenceMonitor(particles_quantity=100)
+    while not monitor.is_finished(steps):
+        monitor.update(config.advance(CONVERGENCE_CHECK_STEPS))
+    temperature, evaporated = monitor.mean_temperature(), monitor.evaporated()
+"""
+import numpy as np
+import math
+
+
+# Число блоков при оценке статистической неэффективности
+BLOCKS_QUANTITY = 10
+# Число рассматриваемых вариантов начала равновесного участка
+EQUILIBRATION_CANDIDATES = 20
+# Допустимая относительная стандартная ошибка средней температуры
+CONVERGENCE_TOLERANCE = 0.02
+# Наименьшее число шагов эксперимента и число шагов между проверками сходимости
+CONVERGENCE_MIN_STEPS = 2000
+CONVERGENCE_CHECK_STEPS = 100
+
+
+def statistical_inefficiency(values, blocks_quantity=BLOCKS_QUANTITY):
+    """ Оценка числа последовательных значений на одно независимое
+        по дисперсии средних blocks_quantity блоков """
+    values = np.asarray(values, dtype=float)
+    block_size = len(values) // blocks_quantity
+    if block_size < 2:
+        return 1.
+    variance = values.var()
+    if variance == 0:
+        return 1.
+    block_means = values[:block_size * blocks_quantity].reshape(blocks_quantity, block_size).mean(axis=1)
+    return max(1., block_size * block_means.var() / variance)
+
+
+def detect_equilibration(values, candidates=EQUILIBRATION_CANDIDATES, blocks_quantity=BLOCKS_QUANTITY):
+    """ Индекс начала равновесного участка: из начал, не дальше середины ряда,
+        выбирается дающее наибольшее эффективное число независимых значений """
+    values = np.asarray(values, dtype=float)
+    size = len(values)
+    best_start, best_effective = 0, 0.
+    for start in np.linspace(0, size // 2, candidates).astype(np.int64):
+        tail = values[start:]
+        effective = len(tail) / statistical_inefficiency(tail, blocks_quantity)
+        if effective > best_effective:
+            best_start, best_effective = int(start), effective
+    return best_start
+
+
+def mean_and_standard_error(values, blocks_quantity=BLOCKS_QUANTITY):
+    """ Среднее коррелированного ряда и его стандартная ошибка по блочным средним """
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0:
+        return 0., 0.
+    block_size = len(values) // blocks_quantity
+    if block_size < 1:
+        return values.mean(), 0.
+    block_means = values[:block_size * blocks_quantity].reshape(blocks_quantity, block_size).mean(axis=1)
+    return values.mean(), block_means.std(ddof=1) / math.sqrt(blocks_quantity)
+
+
+class ConvergenceMonitor:
+    """ Накопление температуры и числа частиц по блокам шагов (ObservableSamples)
+        и проверка сходимости средней температуры и числа испарившихся частиц """
+    def __init__(self, particles_quantity, tolerance=CONVERGENCE_TOLERANCE,
+                 min_steps=CONVERGENCE_MIN_STEPS):
+        self.particles_quantity = particles_quantity
+        # При tolerance = 0 эксперимент рассчитывается до заданного числа шагов
+        self.tolerance = tolerance
+        self.min_steps = min_steps
+        self.temperature_chunks = []
+        self.particles_chunks = []
+        self.steps = 0
+
+    def update(self, samples):
+        """ Добавление наблюдаемых, сохраненных методом advance """
+        self.temperature_chunks.append(samples.temperature)
+        self.particles_chunks.append(samples.particles)
+        self.steps += len(samples)
+
+    @property
+    def temperature(self):
+        if len(self.temperature_chunks) > 1:
+            self.temperature_chunks = [np.concatenate(self.temperature_chunks)]
+        return self.temperature_chunks[0] if self.temperature_chunks else np.zeros(0)
+
+    @property
+    def particles(self):
+        if len(self.particles_chunks) > 1:
+            self.particles_chunks = [np.concatenate(self.particles_chunks)]
+        return self.particles_chunks[0] if self.particles_chunks else np.zeros(0, dtype=np.int64)
+
+    def equilibration_start(self):
+        """ Число начальных шагов, не учитываемых при усреднении """
+        return detect_equilibration(self.temperature)
+
+    def mean_temperature(self):
+        return mean_and_standard_error(self.temperature[self.equilibration_start():])[0]
+
+    def evaporated(self):
+        """ Число испарившихся частиц на последнем шаге """
+        particles = self.particles
+        return self.particles_quantity - int(particles[-1]) if len(particles) else 0
+
+    def is_converged(self):
+        if self.tolerance <= 0 or self.steps < self.min_steps:
+            return False
+        start = self.equilibration_start()
+        temperature = self.temperature[start:]
+        mean, error = mean_and_standard_error(temperature)
+        if error > self.tolerance * abs(mean):
+            return False
+        # Отсутствие дрейфа: средние половин равновесного участка совпадают с точностью tolerance
+        half = len(temperature) // 2
+        if abs(temperature[:half].mean() - temperature[half:].mean()) > self.tolerance * abs(mean):
+            return False
+        # Испарение прекратилось: число частиц не менялось на второй половине равновесного участка
+        particles = self.particles[(start + self.steps) // 2:]
+        return particles.min() == particles.max()
+
+    def is_finished(self, max_steps):
+        """ Эксперимент закончен: рассчитано max_steps шагов, испарились
+            все частицы или средние сошлись """
+        if self.steps >= max_steps:
+            return True
+        if self.steps and self.particles[-1] == 0:
+            return True
+        return self.is_converged()
@@ -0,0 +1,259 @@
+""" Ансамбль независимых систем, рассчитываемых совместно.
+
+R реплик (разные seed, периоды решетки b, температуры) хранятся в общих
+массивах с осью реплик: координаты и скорости имеют форму (R, Nmax, 2).
+Реплики с меньшим числом частиц и испарившиеся частицы отмечаются маской
+alive и не участвуют во взаимодействиях. Шаг алгоритма Верле выполняется
+одним набором векторных операций для всех реплик, поэтому накладные
+расходы на вызов не умножаются на число систем. Пары взаимодействующих
+частиц всех реплик хранятся общим списком Верле с оболочкой skin.
+
+Пример:
+    tasks = create_evaporation_tasks(64, base_seed=1, particles_quantity=16,
+                                     a=PARTICLE_DIAMETER, b=PARTICLE_DIAMETER,
+                                     time_step=0.01 * TAO, is_speeds_rand=True)
+    ensemble = ReplicaEnsemble.from_tasks(tasks)
+    samples = ensemble.advance(5000)
+    start = detect_equilibration(samples.temperature.mean(axis=1))
+    mean, error = mean_and_error(samples.temperature[start:].mean(axis=0))
+"""
+from global_variables import *
+from kernels import pair_potential_ratio, upper_triangle_pairs
+from convergence import detect_equilibration
+
+
+def mean_and_error(values):
+    """ Среднее по репликам и его стандартная ошибка """
+    values = np.asarray(values, dtype=float)
+    if len(values) < 2:
+        return values.mean(), 0.
+    return values.mean(), values.std(ddof=1) / math.sqrt(len(values))
+
+
+class EnsembleSamples:
+    """ Наблюдаемые величины реплик: массивы формы (число записей, R) """
+    COLUMNS = ("step", "E", "Ek", "Ep", "temperature", "particles")
+
+    def __init__(self, capacity, replicas_count):
+        self.size = 0
+        self.step = np.zeros(capacity, dtype=np.int64)
+        self.E = np.zeros((capacity, replicas_count))
+        self.Ek = np.zeros((capacity, replicas_count))
+        self.Ep = np.zeros((capacity, replicas_count))
+        self.temperature = np.zeros((capacity, replicas_count))
+        self.particles = np.zeros((capacity, replicas_count), dtype=np.int64)
+
+    def __len__(self):
+        return self.size
+
+    def record(self, ensemble):
+        index = self.size
+        self.step[index] = ensemble.step_count
+        self.E[index] = ensemble.E
+        self.Ek[index] = ensemble.Ek
+        self.Ep[index] = ensemble.Ep
+        self.temperature[index] = ensemble.temperature
+        self.particles[index] = ensemble.alive.sum(axis=1)
+        self.size += 1
+
+    def trim(self):
+        for column in self.COLUMNS:
+            setattr(self, column, getattr(self, column)[:self.size])
+        return self
+
+
+class ReplicaEnsemble:
+    """ R реплик ParticleConfiguration в общих массивах """
+    def __init__(self, configurations, skin=NEIGHBOR_SKIN):
+        if not configurations:
+            raise ValueError("Ансамбль должен содержать хотя бы одну реплику")
+        # Ансамбль рассчитывает открытую ячейку с точным потенциалом и постоянным шагом
+        for config in configurations:
+            if config.boundary != "open":
+                raise ValueError("Ансамбль не поддерживает границу %s" % config.boundary)
+            if config.potential != "analytic":
+                raise ValueError("Ансамбль не поддерживает потенциал %s" % config.potential)
+            if config.integrator != "verlet":
+                raise ValueError("Ансамбль не поддерживает интегрирование %s" % config.integrator)
+        self.replicas_count = len(configurations)
+        self.capacity = max(len(config.store) for config in configurations)
+        shape = (self.replicas_count, self.capacity)
+
+        self.positions = np.zeros(shape + (2,))
+        self.velocities = np.zeros(shape + (2,))
+        self.forces = np.zeros(shape + (2,))
+        self.masses = np.ones(shape)
+        self.alive = np.zeros(shape, dtype=bool)
+        for index, config in enumerate(configurations):
+            store = config.store
+            count = len(store)
+            self.positions[index, :count] = store.positions
+            self.velocities[index, :count] = store.velocities
+            self.masses[index, :count] = store.masses
+            self.alive[index, :count] = True
+
+        # Параметры реплик в форме, пригодной для расширения по осям частиц и пар
+        self.a = np.array([config.a for config in configurations])[:, np.newaxis]
+        self.time_step = np.array([config.time_step for config in configurations])[:, np.newaxis, np.newaxis]
+        self.l_min = np.array([config.l_min for config in configurations])[:, np.newaxis, np.newaxis]
+        self.l_max = np.array([config.l_max for config in configurations])[:, np.newaxis, np.newaxis]
+
+        # Список пар в развернутых массивах (R * Nmax): индексы частиц и номер реплики
+        self.skin = skin
+        self.pairs_i = None
+        self.pairs_j = None
+        self.pairs_replica = None
+        self.reference = None
+        self.rebuild_count = 0
+
+        self.step_count = 0
+        # Шаг, на котором частица покинула ячейку (-1 - не покидала)
+        self.evaporation_step = np.full(shape, -1, dtype=np.int64)
+
+        self.E = np.zeros(self.replicas_count)
+        self.Ek = np.zeros(self.replicas_count)
+        self.Ep = np.zeros(self.replicas_count)
+        self.temperature = np.zeros(self.replicas_count)
+
+        self.calculate_forces()
+        self.calculate_observables()
+
+    @classmethod
+    def from_tasks(cls, tasks):
+        """ Создание ансамбля по параметрам экспериментов (см. sweep.create_evaporation_tasks) """
+        configurations = []
+        for task in tasks:
+            configurations.append(ParticleConfiguration(task["particles_quantity"],
+                                                        task["a"],
+                                                        task["b"],
+                                                        task["time_step"],
+                                                        is_coords_rand=task.get("is_coords_rand", False),
+                                                        is_speeds_rand=task.get("is_speeds_rand", False),
+                                                        is_research_speed=task.get("is_research_speed", False),
+                                                        system_temp=task.get("system_temp", 0),
+                                                        cell_length=task.get("cell_length", L_CELL),
+                                                        lattice=task.get("lattice", "square"),
+                                                        boundary=task.get("boundary", "open"),
+                                                        potential=task.get("potential", "analytic"),
+                                                        integrator=task.get("integrator", "verlet"),
+                                                        seed=task.get("seed"),
+                                                        backend="numpy"))
+        return cls(configurations)
+
+    def __len__(self):
+        return self.replicas_count
+
+    @property
+    def particles(self):
+        """ Число оставшихся частиц в каждой реплике """
+        return self.alive.sum(axis=1)
+
+    @property
+    def evaporated(self):
+        """ Число испарившихся частиц в каждой реплике """
+        return (self.evaporation_step >= 0).sum(axis=1)
+
+    def replica_positions(self, index):
+        """ Координаты оставшихся частиц реплики index """
+        return self.positions[index, self.alive[index]]
+
+    def update_pairs(self):
+        """ Перестроение списка пар, если частица сместилась более чем на половину оболочки """
+        if self.reference is not None:
+            displacement = self.positions - self.reference
+            displacement_2 = np.where(self.alive, displacement[:, :, 0] ** 2 + displacement[:, :, 1] ** 2, 0.)
+            if 4 * displacement_2.max() <= self.skin ** 2:
+                return
+
+        # Все пары каждой реплики, отобранные по радиусу обрезания с оболочкой
+        pairs_i, pairs_j = upper_triangle_pairs(self.capacity)
+        delta = self.positions[:, pairs_i] - self.positions[:, pairs_j]
+        rij_2 = delta[:, :, 0] ** 2 + delta[:, :, 1] ** 2
+        is_close = (rij_2 < (R2 + self.skin) ** 2) & self.alive[:, pairs_i] & self.alive[:, pairs_j]
+        replica, pair = np.nonzero(is_close)
+        self.pairs_i = replica * self.capacity + pairs_i[pair]
+        self.pairs_j = replica * self.capacity + pairs_j[pair]
+        self.pairs_replica = replica
+        self.reference = self.positions.copy()
+        self.rebuild_count += 1
+
+    def remove_pairs(self, removed):
+        """ Исключение из списка пар частиц, отмеченных маской removed (R, Nmax) """
+        if self.pairs_i is None:
+            return
+        removed = removed.ravel()
+        kept = ~(removed[self.pairs_i] | removed[self.pairs_j])
+        self.pairs_i = self.pairs_i[kept]
+        self.pairs_j = self.pairs_j[kept]
+        self.pairs_replica = self.pairs_replica[kept]
+
+    def calculate_forces(self):
+        """ Силы и потенциальные энергии по спискам пар всех реплик """
+        self.update_pairs()
+        size = self.replicas_count * self.capacity
+        positions = self.positions.reshape(size, 2)
+        delta = positions[self.pairs_i] - positions[self.pairs_j]
+        rij_2 = delta[:, 0] ** 2 + delta[:, 1] ** 2
+        potential, ratio = pair_potential_ratio(rij_2, self.a[self.pairs_replica, 0], PARTICLE_DIAMETER,
+                                                D, R1, R2)
+
+        forces = self.forces.reshape(size, 2)
+        for axis in range(2):
+            pair_force = ratio * delta[:, axis]
+            forces[:, axis] = np.bincount(self.pairs_i, pair_force, size) - \
+                np.bincount(self.pairs_j, pair_force, size)
+        self.Ep = np.bincount(self.pairs_replica, potential, self.replicas_count)
+
+    def calculate_verle(self):
+        """ Шаг скоростного алгоритма Верле для всех реплик """
+        masses = self.masses[:, :, np.newaxis]
+        forces_prev = self.forces.copy()
+        self.positions += self.velocities * self.time_step + forces_prev / (2. * masses) * self.time_step ** 2
+        self.calculate_forces()
+        self.velocities += (self.forces + forces_prev) / (2. * masses) * self.time_step
+
+    def calculate_observables(self):
+        """ Энергии и температура каждой реплики """
+        alive = self.alive
+        v_2 = np.where(alive, self.velocities[:, :, 0] ** 2 + self.velocities[:, :, 1] ** 2, 0.)
+        self.Ek = 0.5 * (self.masses * v_2).sum(axis=1)
+        self.E = self.Ek + self.Ep
+        particles_count = alive.sum(axis=1)
+        self.temperature = np.divide(self.Ek, particles_count * K_B,
+                                     out=np.zeros(self.replicas_count), where=particles_count > 0)
+
+    def check_evaporated_particles(self):
+        """ Исключение частиц, покинувших расчетную ячейку своей реплики """
+        outside = np.any((self.positions < self.l_min) | (self.positions > self.l_max), axis=2) & self.alive
+        if outside.any():
+            self.evaporation_step[outside] = self.step_count
+            self.alive &= ~outside
+            self.velocities[outside] = 0.
+            self.forces[outside] = 0.
+            self.remove_pairs(outside)
+
+    def calculate_next_time_step(self):
+        self.step_count += 1
+        self.calculate_verle()
+        self.calculate_observables()
+        self.check_evaporated_particles()
+
+    def advance(self, steps_quantity, sample_every=1):
+        """ Расчет блока шагов; наблюдаемые сохраняются на шагах, кратных sample_every """
+        samples = EnsembleSamples(steps_quantity // sample_every + 1, self.replicas_count)
+        for _ in range(steps_quantity):
+            self.calculate_next_time_step()
+            if self.step_count % sample_every == 0:
+                samples.record(self)
+        return samples.trim()
+
+
+def run_ensemble_experiments(tasks, steps=STEPS):
+    """ Эксперименты sweep.run_evaporation_experiment, рассчитанные одним ансамблем
+        на steps шагов: средние температуры равновесных участков и числа
+        испарившихся частиц реплик """
+    ensemble = ReplicaEnsemble.from_tasks(tasks)
+    samples = ensemble.advance(steps)
+    temperature = [samples.temperature[detect_equilibration(column):, index].mean()
+                   for index, column in enumerate(samples.temperature.T)]
+    return np.array(temperature), ensemble.evaporated
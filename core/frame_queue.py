@@ -0,0 +1,62 @@
+""" Передача кадров из расчетного потока в поток интерфейса.
+
+Расчетный поток публикует неизменяемые снимки состояния (Frame),
+поток интерфейса забирает их по таймеру. Очередь кадров ограничена:
+если отрисовка не успевает за расчетом, устаревшие кадры вытесняются
+новыми и расчет не ждет отрисовку. Точки графиков наблюдаемых величин
+хранятся отдельно и не вытесняются.
+"""
+import collections
+import threading
+
+
+# Число кадров, ожидающих отрисовки
+FRAME_QUEUE_LENGTH = 2
+
+
+class Frame:
+    """ Снимок положений частиц для отрисовки """
+    def __init__(self, step, positions, title=""):
+        self.step = step
+        # Копия массива защищена от записи: расчет продолжает менять исходный
+        self.positions = positions.copy()
+        self.positions.setflags(write=False)
+        self.title = title
+
+    @classmethod
+    def from_configuration(cls, config, title=""):
+        return cls(config.step_count, config.store.positions, title)
+
+
+class FrameQueue:
+    """ Ограниченная потокобезопасная очередь кадров и точек графиков """
+    def __init__(self, maxlen=FRAME_QUEUE_LENGTH):
+        self.lock = threading.Lock()
+        self.frames = collections.deque(maxlen=maxlen)
+        self.points = []
+        self.dropped_count = 0
+
+    def put_frame(self, frame):
+        """ Добавление кадра; при заполненной очереди вытесняется самый старый """
+        with self.lock:
+            if len(self.frames) == self.frames.maxlen:
+                self.dropped_count += 1
+            self.frames.append(frame)
+
+    def put_point(self, name, x, y):
+        """ Добавление точки графика name """
+        with self.lock:
+            self.points.append((name, x, y))
+
+    def take(self):
+        """ Последний кадр (или None) и все накопленные точки графиков """
+        with self.lock:
+            frame = self.frames[-1] if self.frames else None
+            self.frames.clear()
+            points, self.points = self.points, []
+        return frame, points
+
+    def clear(self):
+        with self.lock:
+            self.frames.clear()
+            self.points = []
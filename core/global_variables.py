@@ -1,3 +1,9 @@
+from kernels import pair_interactions_parallel
+from backends import BACKENDS, get_backend
+from potential_table import TABLE_POINTS, get_potential_table
+from concurrent.futures import ThreadPoolExecutor
+from neighbors import CellList, VerletList
+from lattice import LATTICES, lattice_positions, jitter_positions
 import random
 import math
 import numpy as np
@@ -36,6 +42,24 @@ MPL_RADIUS = 1.
 # Постоянная Больцмана
 K_B = 1.380649e-23
 
+# Число частиц, начиная с которого используется список соседей
+NEIGHBOR_SEARCH_THRESHOLD = 25
+# Толщина оболочки списка соседей Верле
+NEIGHBOR_SKIN = 0.3 * PARTICLE_DIAMETER
+# Число пар, начиная с которого силы считаются в нескольких потоках
+PARALLEL_PAIRS_THRESHOLD = 50000
+
+# Адаптивный шаг по времени: наибольшее смещение частицы за шаг [метр],
+# наибольший рост шага между соседними шагами и допустимое изменение
+# полной энергии за шаг в единицах D на частицу
+ADAPTIVE_DISPLACEMENT = 0.02 * PARTICLE_DIAMETER
+ADAPTIVE_GROWTH = 1.2
+ADAPTIVE_ENERGY_TOLERANCE = 1e-3
+
+# Наименьшее расстояние между частицами после случайных смещений от узлов решетки,
+# доля от меньшего из параметров a и b
+JITTER_MIN_DISTANCE_RATIO = 0.8
+
 
 class Particle:
     """ Класс, описывающий частицу """
@@ -83,115 +107,332 @@ class Particle:
         return x, y, rad
 
 
+def transform_world_to_screen(values):
+    """ Перевод массива мировых координат или длин в экранные """
+    k = (MPL_MAX_RANGE - MPL_MIN_RANGE) / (L_MAX_RANGE - L_MIN_RANGE)
+    return MPL_MIN_RANGE + k * (np.asarray(values) - L_MIN_RANGE)
+
+
+def _store_field(name, column=None):
+    """ Свойство, связывающее атрибут частицы с массивом хранилища """
+    def getter(self):
+        array = getattr(self._store, name)
+        if column is None:
+            return float(array[self._index])
+        return float(array[self._index, column])
+
+    def setter(self, value):
+        array = getattr(self._store, name)
+        if column is None:
+            array[self._index] = value
+        else:
+            array[self._index, column] = value
+
+    return property(getter, setter)
+
+
+class ParticleView(Particle):
+    """ Представление i-й частицы хранилища в виде объекта Particle """
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+
+    x = _store_field("positions", 0)
+    y = _store_field("positions", 1)
+    vx = _store_field("velocities", 0)
+    vy = _store_field("velocities", 1)
+    Fx = _store_field("forces", 0)
+    Fy = _store_field("forces", 1)
+    Ep = _store_field("potentials")
+    mass = _store_field("masses")
+    radius = _store_field("radii")
+
+
+class ParticleStore:
+    """ Хранилище частиц в виде структуры массивов """
+    def __init__(self, positions, velocities=None, mass=PARTICLE_MASS, radius=PARTICLE_RADIUS):
+        # Координаты [метр] и скорости [метр/с], форма (N, 2)
+        self.positions = np.array(positions, dtype=float).reshape(-1, 2)
+        particles_count = len(self.positions)
+        if velocities is None:
+            self.velocities = np.zeros((particles_count, 2))
+        else:
+            self.velocities = np.array(velocities, dtype=float).reshape(-1, 2)
+
+        # Силы [Н] и потенциальные энергии частиц [Дж]
+        self.forces = np.zeros((particles_count, 2))
+        self.potentials = np.zeros(particles_count)
+
+        # Массы [кг] и радиусы [метр]
+        self.masses = np.full(particles_count, mass, dtype=float)
+        self.radii = np.full(particles_count, radius, dtype=float)
+
+        # Идентификаторы частиц, сохраняющиеся при удалении других частиц
+        self.ids = np.arange(particles_count, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, index):
+        particles_count = len(self)
+        if index < 0:
+            index += particles_count
+        if not 0 <= index < particles_count:
+            raise IndexError("Индекс частицы вне диапазона")
+        return ParticleView(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield ParticleView(self, index)
+
+    def compact(self, keep_mask):
+        """ Удаление частиц, для которых маска равна False """
+        self.positions = self.positions[keep_mask]
+        self.velocities = self.velocities[keep_mask]
+        self.forces = self.forces[keep_mask]
+        self.potentials = self.potentials[keep_mask]
+        self.masses = self.masses[keep_mask]
+        self.radii = self.radii[keep_mask]
+        self.ids = self.ids[keep_mask]
+
+
+class ObservableSamples:
+    """ Наблюдаемые величины, сохраненные методом advance """
+    COLUMNS = ("step", "time", "E", "Ek", "Ep", "temperature", "particles")
+
+    def __init__(self, capacity):
+        self.size = 0
+        self.step = np.zeros(capacity, dtype=np.int64)
+        self.time = np.zeros(capacity)
+        self.E = np.zeros(capacity)
+        self.Ek = np.zeros(capacity)
+        self.Ep = np.zeros(capacity)
+        self.temperature = np.zeros(capacity)
+        self.particles = np.zeros(capacity, dtype=np.int64)
+
+    def __len__(self):
+        return self.size
+
+    def record(self, config):
+        """ Сохранение текущих значений конфигурации """
+        index = self.size
+        self.step[index] = config.step_count
+        self.time[index] = config.time
+        self.E[index] = config.E
+        self.Ek[index] = config.Ek
+        self.Ep[index] = config.Ep
+        self.temperature[index] = config.temperature
+        self.particles[index] = len(config.store)
+        self.size += 1
+
+    def trim(self):
+        """ Отбрасывание незаполненной части массивов """
+        for column in self.COLUMNS:
+            setattr(self, column, getattr(self, column)[:self.size])
+        return self
+
+
+class EvaporationRecords:
+    """ Частицы, покинувшие расчетную ячейку: шаг, идентификатор,
+        координаты и скорость в момент вылета """
+    COLUMNS = ("step", "time", "ids", "positions", "velocities")
+
+    def __init__(self, capacity):
+        # Каждая частица испаряется не более одного раза
+        self.size = 0
+        self.step = np.zeros(capacity, dtype=np.int64)
+        self.time = np.zeros(capacity)
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.positions = np.zeros((capacity, 2))
+        self.velocities = np.zeros((capacity, 2))
+
+    def __len__(self):
+        return self.size
+
+    def record(self, step, time, store, mask):
+        """ Сохранение частиц хранилища, отмеченных маской """
+        first = self.size
+        self.size += int(np.count_nonzero(mask))
+        self.step[first:self.size] = step
+        self.time[first:self.size] = time
+        self.ids[first:self.size] = store.ids[mask]
+        self.positions[first:self.size] = store.positions[mask]
+        self.velocities[first:self.size] = store.velocities[mask]
+
+    def column(self, name):
+        """ Заполненная часть столбца name """
+        return getattr(self, name)[:self.size]
+
+
 class ParticleConfiguration:
     def __init__(self, particles_quantity, a_parameter, b_parameter,
                  time_step, is_coords_rand = False,
-                 is_speeds_rand = False, is_research_speed=False, system_temp=0):
+                 is_speeds_rand = False, is_research_speed=False, system_temp=0,
+                 backend="auto", neighbor_search="auto", cell_length=L_CELL,
+                 skin=NEIGHBOR_SKIN, seed=None, workers=1, boundary="open",
+                 potential="analytic", table_points=TABLE_POINTS, integrator="verlet",
+                 time_step_min=None, time_step_max=None, energy_tolerance=ADAPTIVE_ENERGY_TOLERANCE,
+                 lattice="square"):
         self.particles_quantity = particles_quantity
         self.a = a_parameter
         self.b = b_parameter
         self.time_step = time_step
-        self.ticks = self.get_ticks_by_b_parameter(self.b)
+        # Интегрирование: "verlet" - постоянный шаг time_step, "adaptive" - шаг
+        # в пределах [time_step_min; time_step_max] по наибольшим скорости и ускорению
+        # с отменой шага при изменении энергии больше energy_tolerance * D на частицу
+        if integrator not in ("verlet", "adaptive"):
+            raise ValueError("Неизвестный способ интегрирования: %s" % integrator)
+        self.integrator = integrator
+        self.time_step_min = time_step / 4. if time_step_min is None else time_step_min
+        self.time_step_max = 10. * time_step if time_step_max is None else time_step_max
+        self.energy_tolerance = energy_tolerance
+        # Шаг, использованный на последнем шаге, и число отмененных шагов
+        self.current_time_step = time_step
+        self.rejected_steps = 0
+        # Границы расчетной ячейки
+        self.l_max = cell_length / 2.
+        self.l_min = -self.l_max
+        # Граница ячейки: "open" - вылетевшие частицы удаляются (испарение),
+        # "periodic" - периодические условия с минимальным образом, число частиц постоянно
+        if boundary not in ("open", "periodic"):
+            raise ValueError("Неизвестный тип границы: %s" % boundary)
+        self.boundary = boundary
+        self.box = cell_length if boundary == "periodic" else 0.
+        if self.box and self.box < 2 * (R2 + skin):
+            raise ValueError("Периодическая ячейка должна быть не меньше двух радиусов обрезания с оболочкой")
+        # Решетка начального расположения частиц: "square" или "hexagonal" (см. lattice)
+        if lattice not in LATTICES:
+            raise ValueError("Неизвестный тип решетки: %s" % lattice)
+        self.lattice = lattice
         # Чекпоинты для внесения случайности в значения
         self.is_coords_random = is_coords_rand
         self.is_speeds_random = is_speeds_rand
         self.is_research_speed = is_research_speed
         self.system_temp = system_temp
 
+        # Вычислительная реализация: "numpy", "python", "numba" или "auto" (см. backends)
+        self.backend = get_backend(backend)
+        # Потенциал: "analytic" - точная формула, "table" - интерполяция
+        # по таблице из table_points узлов (см. potential_table)
+        if potential not in ("analytic", "table"):
+            raise ValueError("Неизвестный способ расчета потенциала: %s" % potential)
+        self.potential = potential
+        self.potential_table = None
+        if potential == "table":
+            self.potential_table = get_potential_table(self.a, PARTICLE_DIAMETER, D, R1, R2, table_points)
+        # Поиск соседей: "all" - все пары, "cells" - по ячейкам на каждом шаге,
+        # "verlet" - список Верле с оболочкой, "auto" - выбор по числу частиц
+        if neighbor_search not in ("auto", "all", "cells", "verlet"):
+            raise ValueError("Неизвестный способ поиска соседей: %s" % neighbor_search)
+        self.neighbor_search = neighbor_search
+        self.cell_list = CellList(R2 + skin, self.l_min, self.l_max, periodic=boundary == "periodic")
+        self.verlet_list = VerletList(R2, skin, self.cell_list)
+        # Число потоков для расчета сил
+        self.workers = 1
+        self.executor = None
+        self.set_workers(workers)
+
+        # Генератор случайных чисел: собственный при заданном seed, иначе общий модуль random
+        self.rng = random.Random(seed) if seed is not None else random
+
         self.rand_percent = 0.01
         self.speeds_range_rand = 20
 
-        self.configuration = []
+        self.store = None
         self.configure_particles()
+        if self.box:
+            self.check_periodic_positions()
         self.start_summary_pulse()
 
+        # Журнал испарившихся частиц
+        self.evaporated = EvaporationRecords(len(self.store))
+
+        # Число рассчитанных шагов по времени и моделируемое время [с]
+        self.step_count = 0
+        self.time = 0.0
+
         # Энергии
         self.E = 0.0
         self.Ek = 0.0
         self.Ep = 0.0
         self.temperature = 0.0
 
-        self.calculate_potential_for_particle()
-        self.calculate_forces()
-
-    def get_ticks_by_b_parameter(self, b_world):
-        buffer = Particle(b_world, 0)
-        b_screen, _, _ = buffer.transform_world_to_screen()
-        xy_positive = np.arange(0, MPL_MAX_RANGE, b_screen / 2.)
-        xy_negative = xy_positive[::-1]
-        xy_negative = [-x for x in xy_negative]
-        xy_ticks = xy_negative + xy_positive
-        return list(xy_ticks)
-
-    def sign_randomization(self):
-        return 1 if random.random() < 0.5 else -1
+        self.calculate_interactions()
+
+    def __getstate__(self):
+        """ Состояние для контрольной точки (см. checkpoint) """
+        state = self.__dict__.copy()
+        state["executor"] = None
+        state["backend"] = self.backend.name
+        if self.rng is random:
+            # Общий генератор модуля random сохраняется по состоянию
+            state["rng"] = None
+            state["shared_rng_state"] = random.getstate()
+        return state
+
+    def __setstate__(self, state):
+        shared_rng_state = state.pop("shared_rng_state", None)
+        backend = state["backend"]
+        self.__dict__.update(state)
+        if shared_rng_state is not None:
+            self.rng = random
+            random.setstate(shared_rng_state)
+        # При отсутствии numba на другом узле используется реализация по умолчанию
+        self.backend = get_backend(backend if backend in BACKENDS else "auto")
+        self.set_workers(self.workers)
+
+    @property
+    def configuration(self):
+        """ Частицы системы в виде последовательности объектов Particle """
+        return self.store
 
     def configure_particles(self):
-        configuration_coordinates = []
-        # ВАЖНО! Рассматривается ТОЛЬКО число частиц формата n*n
-        particles_count_in_line = round(math.sqrt(self.particles_quantity))
-        for i in range(0, particles_count_in_line):
-            middle_index = math.trunc(len(self.ticks) / 2)
-            configuration_coordinates.append(self.ticks[middle_index])
-            self.ticks.pop(middle_index)
-
-        for coord_y in configuration_coordinates:
-            for coord_x in configuration_coordinates:
-                particle = Particle(coord_x, coord_y)
-                x, y, rad = particle.transform_screen_to_world()
-
-                if self.is_coords_random:
-                    rand_range = self.b * self.rand_percent
-                    x_rand = random.uniform(-rand_range, rand_range)
-                    y_rand = random.uniform(-rand_range, rand_range)
-                    x += x_rand
-                    y += y_rand
-
-                particle.x = x
-                particle.y = y
-
-                if self.is_speeds_random:
-                    x_rand = random.uniform(-self.speeds_range_rand, self.speeds_range_rand)
-                    y_rand = random.uniform(-self.speeds_range_rand, self.speeds_range_rand)
-                    particle.vx = x_rand
-                    particle.vy = y_rand
-
-                if self.is_research_speed:
-                    temp = self.system_temp
-                    upper = 2 * K_B * temp
-                    lower = PARTICLE_MASS
-                    # Полная скорость каждой частицы для достижения заданной температуры
-                    vi = upper / lower
-                    sign_x = self.sign_randomization()
-                    sign_y = self.sign_randomization()
-                    partition_x = random.random() * vi
-                    partition_y = vi - partition_x
-                    particle.vx = sign_x * partition_x
-                    particle.vy = sign_y * partition_y
-
-
-                self.configuration.append(particle)
+        """ Размещение частиц в узлах решетки капли и задание скоростей """
+        particles_count = self.particles_quantity
+        # Массивы случайных величин берутся из генератора numpy, начальное
+        # состояние которого задается генератором конфигурации
+        rng = np.random.default_rng(self.rng.getrandbits(64))
+        positions = lattice_positions(self.lattice, particles_count, self.b)
+        if self.is_coords_random:
+            positions = jitter_positions(positions, self.b * self.rand_percent,
+                                         JITTER_MIN_DISTANCE_RATIO * min(self.a, self.b), rng, spacing=self.b)
+
+        velocities = np.zeros((particles_count, 2))
+        if self.is_speeds_random:
+            velocities = rng.uniform(-self.speeds_range_rand, self.speeds_range_rand, (particles_count, 2))
+
+        if self.is_research_speed:
+            temp = self.system_temp
+            upper = 2 * K_B * temp
+            lower = PARTICLE_MASS
+            # Полная скорость каждой частицы для достижения заданной температуры
+            vi = upper / lower
+            signs = np.where(rng.random((particles_count, 2)) < 0.5, 1., -1.)
+            partition_x = rng.random(particles_count) * vi
+            velocities = signs * np.column_stack((partition_x, vi - partition_x))
+
+        self.store = ParticleStore(positions, velocities)
+
+    def check_periodic_positions(self):
+        """ Возврат начальных положений в периодическую ячейку и проверка,
+            что периодические образы частиц капли не перекрываются """
+        positions = self.store.positions
+        if np.ptp(positions, axis=0).max() >= self.box:
+            raise ValueError("Начальная капля не помещается в периодическую ячейку")
+        self.wrap_positions()
+        min_distance = JITTER_MIN_DISTANCE_RATIO * min(self.a, self.b)
+        self.cell_list.build(positions)
+        pairs_i, _ = self.cell_list.pairs(positions, min_distance)
+        if len(pairs_i):
+            raise ValueError("Периодические образы частиц начальной капли ближе допустимого расстояния")
 
     def start_summary_pulse(self):
-        vx_sum = 0.0
-        vy_sum = 0.0
-        for particle in self.configuration:
-            vx_sum += particle.vx
-            vy_sum += particle.vy
-
-        particles_count = len(self.configuration)
-        vx_sum /= particles_count
-        vy_sum /= particles_count
-
-        for particle in self.configuration:
-            particle.vx -= vx_sum
-            particle.vy -= vy_sum
+        # Вычитание скорости центра масс
+        self.store.velocities -= self.store.velocities.mean(axis=0)
 
     # Расчет энергий
     def calculate_kinetic(self):
-        sum_v = 0.0
-        for i, particle in enumerate(self.configuration):
-            sum_v += particle.vx ** 2 + particle.vy ** 2
+        sum_v = np.sum(self.store.velocities ** 2)
         kinetic_energy = PARTICLE_MASS / 2.
         kinetic_energy *= sum_v
         self.Ek = kinetic_energy
@@ -234,13 +475,7 @@ class ParticleConfiguration:
         return potential
 
     def calculate_potential(self):
-        potential_energy = 0.0
-        for i, i_particle in enumerate(self.configuration):
-            for j, j_particle in enumerate(self.configuration):
-                if i < j:
-                    potential_energy += self.potential_of_lennard_jones(i_particle, j_particle)
-
-        self.Ep = potential_energy
+        self.calculate_interactions()
         # print("Потенциальная энергия: ", self.Ep)
 
     def calculate_full_energy(self):
@@ -248,97 +483,180 @@ class ParticleConfiguration:
         # print("Полная энергия: ", self.E)
 
     def calculate_temperature(self):
-        v_sum = 0.0
-        for particle in self.configuration:
-            v_sum += particle.vx ** 2 + particle.vy ** 2
+        v_sum = np.sum(self.store.velocities ** 2)
 
-        upper = v_sum * self.configuration[0].mass
-        lower = 2.0 * len(self.configuration) * K_B
+        upper = v_sum * self.store.masses[0]
+        lower = 2.0 * len(self.store) * K_B
         self.temperature = upper / lower
         # print("Температура в системе: ", self.temperature)
         # print('\n')
 
+    def calculate_observables(self):
+        """ Расчет Ek, E и температуры за один проход по скоростям.
+            Ep уже получена при расчете сил на текущем шаге """
+        v_sum = np.sum(self.store.velocities ** 2)
+        self.Ek = PARTICLE_MASS / 2. * v_sum
+        self.E = self.Ek + self.Ep
+        self.temperature = v_sum * self.store.masses[0] / (2.0 * len(self.store) * K_B)
+
     # Расчет сил, координат и скоростей
+    def calculate_interactions(self):
+        """ Совместный расчет сил, потенциальных энергий частиц
+            и полной потенциальной энергии системы """
+        positions = self.store.positions
+        search = self.get_neighbor_search()
+        if search != "all":
+            if search == "verlet":
+                pairs_i, pairs_j = self.verlet_list.update(positions)
+            else:
+                self.cell_list.build(positions)
+                pairs_i, pairs_j = self.cell_list.pairs(positions, R2)
+            if self.executor is not None and len(pairs_i) >= PARALLEL_PAIRS_THRESHOLD:
+                forces, potentials, potential_energy = pair_interactions_parallel(positions, pairs_i, pairs_j,
+                                                                                  self.a, PARTICLE_DIAMETER,
+                                                                                  D, R1, R2, self.executor,
+                                                                                  self.workers,
+                                                                                  self.backend.pair_interactions,
+                                                                                  self.box, self.potential_table)
+            else:
+                forces, potentials, potential_energy = self.backend.pair_interactions(positions,
+                                                                                      pairs_i, pairs_j,
+                                                                                      self.a, PARTICLE_DIAMETER,
+                                                                                      D, R1, R2, self.box,
+                                                                                      self.potential_table)
+        else:
+            forces, potentials, potential_energy = self.backend.all_pair_interactions(positions, self.a,
+                                                                                      PARTICLE_DIAMETER,
+                                                                                      D, R1, R2, self.box,
+                                                                                      self.potential_table)
+        self.store.forces[:] = forces
+        self.store.potentials[:] = potentials
+        self.Ep = potential_energy
+
+    def set_workers(self, workers):
+        """ Задание числа потоков для расчета сил """
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        self.workers = max(1, int(workers))
+        if self.workers > 1:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers)
+
+    def get_neighbor_search(self):
+        """ Способ поиска соседей на текущем шаге """
+        if self.neighbor_search == "auto":
+            if len(self.store) >= NEIGHBOR_SEARCH_THRESHOLD:
+                return "verlet"
+            return "all"
+        return self.neighbor_search
+
+    @property
+    def neighbor_rebuilds(self):
+        """ Число перестроений списка соседей Верле """
+        return self.verlet_list.rebuild_count
+
     def calculate_potential_for_particle(self):
         """ Расчет потецниальной энергии для каждой частицы """
-        for i, i_particle in enumerate(self.configuration):
-            potential = 0.0
-            for j, j_particle in enumerate(self.configuration):
-                if i != j:
-                    potential += self.potential_of_lennard_jones(i_particle, j_particle)
-            i_particle.Ep = potential
+        self.calculate_interactions()
 
     def calculate_forces(self):
         """ Расчет сил """
-        r0_6 = PARTICLE_DIAMETER ** 6
-        for i, i_particle in enumerate(self.configuration):
-            du_dx_sum = 0.0
-            du_dy_sum = 0.0
-            for j, j_particle in enumerate(self.configuration):
-                if i != j:
-                    # Квадрат расстояния между центрами i и j частицы
-                    rij_2 = (i_particle.x - j_particle.x) ** 2 + (i_particle.y - j_particle.y) ** 2
-                    buffer_x = (i_particle.x - j_particle.x) / rij_2 ** 4
-                    buffer_y = (i_particle.y - j_particle.y) / rij_2 ** 4
-                    # Рассчет обрезающего множителя
-                    dist = self.distance(i_particle, j_particle)
-                    K = self.calculate_cutoff_ratio(dist)
-                    du_dx_sum += (r0_6 / rij_2 ** 3 - 1) * buffer_x * K
-                    du_dy_sum += (r0_6 / rij_2 ** 3 - 1) * buffer_y * K
-
-            du_dx = -12 * D * r0_6 * du_dx_sum
-            du_dy = -12 * D * r0_6 * du_dy_sum
-            i_particle.Fx = -du_dx
-            i_particle.Fy = -du_dy
-
-    def calculate_verle(self):
+        self.calculate_interactions()
+
+    def calculate_verle(self, time_step=None):
         """ Скоростная форма алгоритма Верле """
-        Fk_x = []
-        Fk_y = []
-        for i_particle in self.configuration:
-            # Расчет координат
-            # Координата X
-            accel_x = i_particle.Fx / (2 * i_particle.mass)
-            accel_x *= self.time_step ** 2
-            x_new = i_particle.x + i_particle.vx * self.time_step + accel_x
-            i_particle.x = x_new
-            Fk_x.append(i_particle.Fx)
-
-            # Координата Y
-            accel_y = i_particle.Fy / (2 * i_particle.mass)
-            accel_y *= self.time_step ** 2
-            y_new = i_particle.y + i_particle.vy * self.time_step + accel_y
-            i_particle.y = y_new
-            Fk_y.append(i_particle.Fy)
+        store = self.store
+        if time_step is None:
+            time_step = self.time_step
+
+        # Расчет координат
+        forces_prev = store.forces.copy()
+        self.backend.update_positions(store.positions, store.velocities, forces_prev,
+                                      store.masses, time_step)
+        if self.box:
+            self.wrap_positions()
 
         # Пересчет сил
         self.calculate_forces()
 
-        for i, i_particle in enumerate(self.configuration):
-            # Расчет скоростей
-            # Vx
-            accel_avg_x = (i_particle.Fx + Fk_x[i]) / (2. * i_particle.mass)
-            accel_avg_x *= self.time_step
-            i_particle.vx += accel_avg_x
-
-            # Vy
-            accel_avg_y = (i_particle.Fy + Fk_y[i]) / (2. * i_particle.mass)
-            accel_avg_y *= self.time_step
-            i_particle.vy += accel_avg_y
+        # Расчет скоростей
+        self.backend.update_velocities(store.velocities, store.forces, forces_prev,
+                                       store.masses, time_step)
+
+    def choose_time_step(self, velocity_max_2, force_max_2):
+        """ Шаг, при котором самая быстрая частица смещается не более чем
+            на ADAPTIVE_DISPLACEMENT за счет скорости и за счет ускорения """
+        time_step = min(self.time_step_max, ADAPTIVE_GROWTH * self.current_time_step)
+        if velocity_max_2 > 0:
+            time_step = min(time_step, ADAPTIVE_DISPLACEMENT / math.sqrt(velocity_max_2))
+        accel_max = math.sqrt(force_max_2) / self.store.masses.min()
+        if accel_max > 0:
+            time_step = min(time_step, math.sqrt(2 * ADAPTIVE_DISPLACEMENT / accel_max))
+        return max(time_step, self.time_step_min)
+
+    def calculate_adaptive_verle(self):
+        """ Шаг алгоритма Верле с выбором шага по времени. Если полная энергия
+            изменилась больше допустимого, шаг отменяется и повторяется с половинным """
+        store = self.store
+        velocities_2 = np.einsum("ij,ij->i", store.velocities, store.velocities)
+        forces_2 = np.einsum("ij,ij->i", store.forces, store.forces)
+        time_step = self.choose_time_step(velocities_2.max(), forces_2.max())
+        energy_limit = self.energy_tolerance * D * len(store)
+        # Энергия текущего набора частиц (после удаления испарившихся)
+        energy_prev = 0.5 * (store.masses * velocities_2).sum() + 0.5 * store.potentials.sum()
+        saved = (store.positions.copy(), store.velocities.copy(), store.forces.copy(), store.potentials.copy())
+        while True:
+            self.calculate_verle(time_step)
+            self.calculate_observables()
+            if abs(self.E - energy_prev) <= energy_limit or time_step <= self.time_step_min:
+                break
+            store.positions[:], store.velocities[:], store.forces[:], store.potentials[:] = saved
+            time_step = max(time_step / 2., self.time_step_min)
+            self.rejected_steps += 1
+        self.current_time_step = time_step
+
+    def wrap_positions(self):
+        """ Возврат частиц, пересекших периодическую границу, в ячейку """
+        positions = self.store.positions
+        if positions.min(initial=self.l_min) < self.l_min or positions.max(initial=self.l_max) >= self.l_max:
+            positions -= self.box * np.floor((positions - self.l_min) / self.box)
 
     def check_evaporated_particles(self):
-        """ Расчет числа испарившихся частиц """
-        for i, particle in enumerate(self.configuration):
-            if L_MIN_RANGE <= particle.x <= L_MAX_RANGE and L_MIN_RANGE <= particle.y <= L_MAX_RANGE:
-                pass
-            else:
-                del self.configuration[i]
+        """ Удаление частиц, покинувших расчетную ячейку, за один проход """
+        if self.box:
+            return
+        positions = self.store.positions
+        # Обычно все частицы внутри: достаточно проверить крайние координаты
+        if positions.min(initial=self.l_min) >= self.l_min and positions.max(initial=self.l_max) <= self.l_max:
+            return
+        inside = np.all((positions >= self.l_min) & (positions <= self.l_max), axis=1)
+        self.evaporated.record(self.step_count, self.time, self.store, ~inside)
+        self.store.compact(inside)
+        # Список соседей остается действительным для оставшихся частиц
+        self.verlet_list.compact(inside)
 
     def calculate_next_time_step(self):
-        if len(self.configuration) > 0:
-            self.calculate_verle()
-            self.calculate_kinetic()
-            self.calculate_potential()
-            self.calculate_full_energy()
-            self.calculate_temperature()
+        self.step_count += 1
+        if len(self.store) > 0:
+            if self.integrator == "adaptive":
+                self.calculate_adaptive_verle()
+            else:
+                self.calculate_verle()
+                self.calculate_observables()
+            self.time += self.current_time_step
             self.check_evaporated_particles()
+
+    def advance(self, steps_quantity, sample_every=1):
+        """ Расчет блока шагов по времени. Наблюдаемые величины сохраняются
+            после каждого шага, номер которого кратен sample_every.
+            Расчет прекращается, когда испарились все частицы, поэтому
+            блок может оказаться короче steps_quantity шагов """
+        samples = ObservableSamples(steps_quantity // sample_every + 1)
+        step_function = self.calculate_next_time_step
+        for _ in range(steps_quantity):
+            if len(self.store) == 0:
+                break
+            step_function()
+            if self.step_count % sample_every == 0:
+                samples.record(self)
+        return samples.trim()
@@ -0,0 +1,155 @@
+from functools import lru_cache
+import math
+import numpy as np
+
+
+def cutoff_ratio(distance, r1, r2):
+    """ Коэффициент обрезания для массива расстояний """
+    buffer = ((distance - r1) / (r1 - r2)) ** 2
+    smooth = (1 - buffer) ** 2
+    return np.where(distance <= r1, 1., np.where(distance < r2, smooth, 0.))
+
+
+@lru_cache(maxsize=16)
+def upper_triangle_pairs(particles_count):
+    """ Все неупорядоченные пары (i < j) для заданного числа частиц """
+    return np.triu_indices(particles_count, k=1)
+
+
+def minimum_image(delta, box):
+    """ Смещение до ближайшей периодической копии частицы (box > 0) """
+    delta -= box * np.round(delta / box)
+    return delta
+
+
+def pair_displacements(positions, pairs_i, pairs_j, box=0.):
+    """ Смещения r_i - r_j для списка пар (с минимальным образом при box > 0) """
+    delta = positions[pairs_i] - positions[pairs_j]
+    if box:
+        minimum_image(delta, box)
+    return delta
+
+
+def pair_potential_ratio(rij_2, a, r0, e, r1, r2):
+    """ Потенциалы пар и отношения сил к расстояниям по квадратам расстояний """
+    rij_6 = rij_2 ** 3
+    K = cutoff_ratio(np.sqrt(rij_2), r1, r2)
+
+    # Модифицированный потенциал Л-Д
+    sigma_6 = (a / 2 ** (1 / 6.)) ** 6
+    buffer = sigma_6 / rij_6
+    potential = 4 * e * (buffer ** 2 - buffer) * K
+
+    r0_6 = r0 ** 6
+    ratio = 12 * e * r0_6 * (r0_6 / rij_6 - 1) / rij_2 ** 4 * K
+    return potential, ratio
+
+
+def accumulate_pairs(particles_count, pairs_i, pairs_j, delta, potential, ratio):
+    """ Суммирование вкладов пар в силы и потенциальные энергии частиц """
+    # Силы: вклад пары в i-ю и j-ю частицы равен по модулю и противоположен
+    forces = np.empty((particles_count, 2))
+    for axis in range(2):
+        pair_force = ratio * delta[:, axis]
+        forces[:, axis] = np.bincount(pairs_i, pair_force, particles_count) - \
+            np.bincount(pairs_j, pair_force, particles_count)
+
+    potentials = np.bincount(pairs_i, potential, particles_count) + \
+        np.bincount(pairs_j, potential, particles_count)
+    return forces, potentials, potential.sum()
+
+
+def pair_interactions_list(positions, pairs_i, pairs_j, a, r0, e, r1, r2, box=0.):
+    """ Силы, потенциальные энергии частиц и полная потенциальная
+        энергия системы по списку неупорядоченных пар частиц.
+        При box > 0 используются смещения минимального образа
+        в периодической ячейке со стороной box """
+    delta = pair_displacements(positions, pairs_i, pairs_j, box)
+    rij_2 = delta[:, 0] ** 2 + delta[:, 1] ** 2
+    potential, ratio = pair_potential_ratio(rij_2, a, r0, e, r1, r2)
+    return accumulate_pairs(len(positions), pairs_i, pairs_j, delta, potential, ratio)
+
+
+def pair_interactions_parallel(positions, pairs_i, pairs_j, a, r0, e, r1, r2, executor, workers,
+                               kernel=pair_interactions_list, box=0., table=None):
+    """ Расчет по списку пар, разделенному между потоками.
+        Каждый поток накапливает вклады пар (по третьему закону Ньютона
+        в обе частицы) в собственные массивы, которые затем суммируются """
+    bounds = np.linspace(0, len(pairs_i), workers + 1).astype(np.int64)
+    # Табличный потенциал передается только ядрам, которые его принимают
+    arguments = (box,) if table is None else (box, table)
+    futures = [executor.submit(kernel, positions,
+                               pairs_i[first:last], pairs_j[first:last], a, r0, e, r1, r2, *arguments)
+               for first, last in zip(bounds[:-1], bounds[1:])]
+
+    forces, potentials, potential_energy = futures[0].result()
+    for future in futures[1:]:
+        chunk_forces, chunk_potentials, chunk_energy = future.result()
+        forces += chunk_forces
+        potentials += chunk_potentials
+        potential_energy += chunk_energy
+    return forces, potentials, potential_energy
+
+
+def pair_interactions_list_scalar(positions, pairs_i, pairs_j, a, r0, e, r1, r2, box=0.):
+    """ Эталонный поэлементный расчет по списку неупорядоченных пар.
+        Каждая пара считается один раз, вклады в обе частицы противоположны """
+    particles_count = len(positions)
+    forces = np.zeros((particles_count, 2))
+    potentials = np.zeros(particles_count)
+    sigma = a / 2 ** (1 / 6.)
+    r0_6 = r0 ** 6
+    coords = positions.tolist()
+    for i, j in zip(pairs_i.tolist(), pairs_j.tolist()):
+        dx = coords[i][0] - coords[j][0]
+        dy = coords[i][1] - coords[j][1]
+        if box:
+            dx -= box * round(dx / box)
+            dy -= box * round(dy / box)
+        rij_2 = dx ** 2 + dy ** 2
+        distance = math.sqrt(rij_2)
+        if distance <= r1:
+            K = 1.
+        elif distance < r2:
+            K = (1 - ((distance - r1) / (r1 - r2)) ** 2) ** 2
+        else:
+            continue
+
+        potential = 4 * e * ((sigma / distance) ** 12 - (sigma / distance) ** 6) * K
+        potentials[i] += potential
+        potentials[j] += potential
+        ratio = 12 * e * r0_6 * (r0_6 / rij_2 ** 3 - 1) / rij_2 ** 4 * K
+        forces[i, 0] += ratio * dx
+        forces[i, 1] += ratio * dy
+        forces[j, 0] -= ratio * dx
+        forces[j, 1] -= ratio * dy
+
+    return forces, potentials, 0.5 * potentials.sum()
+
+
+def update_positions(positions, velocities, forces, masses, time_step):
+    """ Расчет координат по скоростной форме алгоритма Верле """
+    accel = forces / (2. * masses)[:, np.newaxis] * time_step ** 2
+    positions += velocities * time_step + accel
+
+
+def update_velocities(velocities, forces, forces_prev, masses, time_step):
+    """ Расчет скоростей по силам на текущем и предыдущем шагах """
+    accel_avg = (forces + forces_prev) / (2. * masses)[:, np.newaxis]
+    velocities += accel_avg * time_step
+
+
+def update_positions_scalar(positions, velocities, forces, masses, time_step):
+    """ Поэлементный расчет координат """
+    for i in range(len(positions)):
+        for axis in range(2):
+            accel = forces[i, axis] / (2 * masses[i]) * time_step ** 2
+            positions[i, axis] += velocities[i, axis] * time_step + accel
+
+
+def update_velocities_scalar(velocities, forces, forces_prev, masses, time_step):
+    """ Поэлементный расчет скоростей """
+    for i in range(len(velocities)):
+        for axis in range(2):
+            accel_avg = (forces[i, axis] + forces_prev[i, axis]) / (2. * masses[i])
+            velocities[i, axis] += accel_avg * time_step
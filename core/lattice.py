@@ -0,0 +1,110 @@
+""" Начальное расположение частиц капли.
+
+Узлы квадратной или гексагональной (треугольной) решетки с периодом b
+строятся сразу в мировых координатах и отбираются ближайшими к центру
+ячейки, поэтому число частиц N может быть любым. Квадратная капля
+заполняется квадратными слоями: при N = n*n получается квадрат n x n,
+при других N последний слой заполнен частично. Гексагональная капля
+состоит из N узлов, ближайших к центру.
+
+Случайные смещения частиц от узлов задаются массивом и проверяются
+на перекрытие: смещения частиц, оказавшихся ближе min_distance друг
+к другу, разыгрываются заново, а после JITTER_ATTEMPTS попыток такие
+частицы остаются в узлах.
+"""
+from neighbors import CellList
+import numpy as np
+import math
+
+
+LATTICES = ("square", "hexagonal")
+# Число попыток разыграть смещения перекрывшихся частиц
+JITTER_ATTEMPTS = 10
+
+
+def square_lattice(particles_quantity, b):
+    """ Узлы квадратной решетки, заполняющие квадратные слои вокруг центра """
+    side = math.ceil(math.sqrt(particles_quantity))
+    # Центр квадрата side x side совпадает с центром ячейки
+    coordinates = b * (np.arange(side) - (side - 1) / 2.)
+    x, y = np.meshgrid(coordinates, coordinates)
+    nodes = np.column_stack((x.ravel(), y.ravel()))
+    if len(nodes) > particles_quantity:
+        # Неполный внешний слой: узлы, ближайшие к центру
+        layer = np.abs(nodes).max(axis=1)
+        distance_2 = nodes[:, 0] ** 2 + nodes[:, 1] ** 2
+        order = np.lexsort((distance_2, layer))
+        nodes = nodes[np.sort(order[:particles_quantity])]
+    return nodes
+
+
+def hexagonal_lattice(particles_quantity, b):
+    """ Узлы гексагональной решетки, ближайшие к центру """
+    # Число рядов с запасом: вписанный круг радиусом sqrt(3)/2 * rows * b
+    # содержит около 2.7 * rows^2 узлов
+    rows = math.ceil(math.sqrt(particles_quantity / 2.)) + 1
+    row, column = np.mgrid[-rows:rows + 1, -rows:rows + 1]
+    x = b * (column + 0.5 * (row % 2))
+    y = b * math.sqrt(3) / 2. * row
+    nodes = np.column_stack((x.ravel(), y.ravel()))
+    distance_2 = nodes[:, 0] ** 2 + nodes[:, 1] ** 2
+    if len(nodes) > particles_quantity:
+        # Устойчивая сортировка: при равных расстояниях порядок узлов не зависит от платформы
+        order = np.argsort(distance_2, kind="stable")
+        nodes = nodes[np.sort(order[:particles_quantity])]
+    return nodes
+
+
+def lattice_positions(lattice, particles_quantity, b):
+    """ Координаты узлов решетки lattice для particles_quantity частиц, форма (N, 2) """
+    if lattice == "square":
+        return square_lattice(particles_quantity, b)
+    if lattice == "hexagonal":
+        return hexagonal_lattice(particles_quantity, b)
+    raise ValueError("Неизвестный тип решетки: %s" % lattice)
+
+
+def close_pairs(positions, min_distance):
+    """ Пары частиц, находящихся ближе min_distance """
+    if len(positions) < 2 or min_distance <= 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    l_min = positions.min() - min_distance
+    l_max = positions.max() + min_distance
+    cell_list = CellList(min_distance, l_min, l_max)
+    cell_list.build(positions)
+    return cell_list.pairs(positions, min_distance)
+
+
+def jitter_positions(nodes, amplitude, min_distance, rng, spacing=0.):
+    """ Узлы со случайными смещениями до amplitude по каждой оси.
+        Частицы не сближаются ближе min_distance за счет смещений.
+        spacing - наименьшее расстояние между узлами, если оно известно """
+    positions = nodes + rng.uniform(-amplitude, amplitude, nodes.shape)
+    if spacing - 2 * math.sqrt(2) * amplitude >= min_distance:
+        # Смещения малы: сближение ближе min_distance невозможно
+        return positions
+
+    redraw = np.zeros(len(nodes), dtype=bool)
+    for _ in range(JITTER_ATTEMPTS):
+        pairs_i, pairs_j = close_pairs(positions, min_distance)
+        if len(pairs_i) == 0:
+            return positions
+        # Из каждой пары смещение заново разыгрывается для одной частицы
+        redraw[:] = False
+        redraw[np.maximum(pairs_i, pairs_j)] = True
+        positions[redraw] = nodes[redraw] + rng.uniform(-amplitude, amplitude, (np.count_nonzero(redraw), 2))
+
+    # Оставшиеся частицы возвращаются в узлы; возвращенная частица может
+    # оказаться рядом со смещенной соседкой, поэтому проверка повторяется
+    in_node = np.zeros(len(nodes), dtype=bool)
+    while True:
+        pairs_i, pairs_j = close_pairs(positions, min_distance)
+        redraw[:] = False
+        redraw[pairs_i] = True
+        redraw[pairs_j] = True
+        redraw &= ~in_node
+        if not redraw.any():
+            return positions
+        positions[redraw] = nodes[redraw]
+        in_node |= redraw
@@ -2,14 +2,34 @@ from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as Navigatio
 from mpl_widgets import MplAnimation, MplGraphics, MplResearch
 from PyQt5 import QtWidgets, QtCore
 from global_variables import *
+from sweep import create_evaporation_tasks, iter_sweep
+from checkpoint import save_checkpoint, load_checkpoint
+from observables_log import ObservablesLogger, truncate_observables, truncate_to_size
+from frame_queue import Frame, FrameQueue
+from convergence import ConvergenceMonitor
 import interface_research_app
 import interface_main_app
 import matplotlib
 import threading
 import sys
-import time
+import os
 matplotlib.use('QT5Agg')
 
+# Число шагов, рассчитываемых в исследовании между проверками остановки
+RESEARCH_CHUNK_STEPS = 100
+
+# Файлы контрольных точек (Ctrl+S - сохранение, Ctrl+O - загрузка)
+SIMULATION_CHECKPOINT_PATH = "../simulation_checkpoint.pkl"
+RESEARCH_CHECKPOINT_PATH = "../research_checkpoint.pkl"
+
+# Журналы наблюдаемых величин
+OBSERVABLES_LOG_PATH = "../observables.csv"
+RESEARCH_LOG_PATH = "../research.csv"
+RESEARCH_LOG_COLUMNS = ("experiment", "temperature", "evaporated")
+
+# Интервал опроса очереди кадров потоком интерфейса, мс
+FRAME_TIMER_INTERVAL = 15
+
 
 class ResearchApp(QtWidgets.QMainWindow, interface_research_app.Ui_MainWindow):
     """ Класс-реализация окна исследования """
@@ -34,9 +54,12 @@ class ResearchApp(QtWidgets.QMainWindow, interface_research_app.Ui_MainWindow):
         self.particles_quantity = 100
         self.is_random_coords = False
         self.is_random_speeds = False
+        # Число процессов для параллельного расчета экспериментов
+        self.workers = os.cpu_count() or 1
         self.current_out = 0
         self.current_step = 0
-        self.sum_temperature = 0.0
+        # Накопленные наблюдаемые текущего эксперимента
+        self.monitor = None
 
         self.research_steps.setText(str(self.iter_quantity))
         self.research_steps.textChanged.connect(self.steps_quantity_logic)
@@ -48,21 +71,41 @@ class ResearchApp(QtWidgets.QMainWindow, interface_research_app.Ui_MainWindow):
 
         self.research_thread = StoppableThread(self.calculate_research)
 
+        # Результаты экспериментов передаются в поток интерфейса через очередь
+        self.results = FrameQueue()
+        self.results_timer = QtCore.QTimer(self)
+        self.results_timer.timeout.connect(self.consume_results)
+        self.results_timer.start(FRAME_TIMER_INTERVAL)
+
         self.start_button.clicked.connect(self.start_calculation)
         self.stop_button.clicked.connect(self.stop_calculation)
         self.clear_plot.clicked.connect(self.clear_plot_logic)
 
         self.title_text = "Зависимость скорости испарения капли от температуры"
 
+        # Результаты экспериментов дописываются в журнал исследования
+        self.results_logger = None
+        self.open_results_logger()
+
+    def open_results_logger(self):
+        research_parameters = {"particles_quantity": self.particles_quantity,
+                               "a": PARTICLE_DIAMETER,
+                               "b": PARTICLE_DIAMETER,
+                               "time_step": self.time_step}
+        self.results_logger = ObservablesLogger(RESEARCH_LOG_PATH, RESEARCH_LOG_COLUMNS,
+                                                research_parameters, append=True)
+
     def clear_plot_logic(self):
         self.stop_calculation()
+        self.research_thread.wait()
+        self.results.clear()
         self.x_values.clear()
         self.y_values.clear()
         self.graphics.clear_plot()
         self.graphics.draw()
         self.current_out = 0
         self.current_step = 0
-        self.sum_temperature = 0.0
+        self.monitor = None
 
     def steps_quantity_logic(self):
         self.iter_quantity = int(self.research_steps.text())
@@ -75,45 +118,84 @@ class ResearchApp(QtWidgets.QMainWindow, interface_research_app.Ui_MainWindow):
         self.horizontal_layout_graphics.addWidget(self.graphics)
 
     def research_inner_loop(self, print_text):
-        # Расчет 5000 итераций для выбранного b
-        self.sum_temperature = 0.0
-        for iter in range(self.current_step, self.iter_quantity):
-            sys.stdout.write(print_text + "; Текущий шаг: %s" % iter)
+        # Расчет не более iter_quantity итераций для выбранного b
+        # блоками по RESEARCH_CHUNK_STEPS шагов.
+        # Эксперимент заканчивается раньше, если испарились все частицы или средние сошлись
+        if self.current_step == 0:
+            self.monitor = ConvergenceMonitor(len(self.config.store))
+        while not self.monitor.is_finished(self.iter_quantity):
+            sys.stdout.write(print_text + "; Текущий шаг: %s" % self.monitor.steps)
             sys.stdout.flush()
             if self.research_thread.is_stopped():
-                self.current_step = iter
+                self.current_step = self.monitor.steps
                 return
 
-            self.config.calculate_next_time_step()
-            if iter >= 500:
-                self.sum_temperature += self.config.temperature
+            chunk = min(RESEARCH_CHUNK_STEPS, self.iter_quantity - self.monitor.steps)
+            self.monitor.update(self.config.advance(chunk))
 
         self.current_step = 0
 
-        # Средняя температура
-        self.sum_temperature /= (self.iter_quantity - 500)
-        self.x_values.append(self.sum_temperature)
-
-        # Количество испарившихся частиц
-        evaporated_particles = self.particles_quantity - len(self.config.configuration)
-        self.y_values.append(evaporated_particles)
-
-        self.draw_plot(self.x_values, self.y_values)
+        # Средняя температура равновесного участка и количество испарившихся частиц
+        evaporated_particles = len(self.config.evaporated)
+        self.add_research_result(self.monitor.mean_temperature(), evaporated_particles)
+
+    def add_research_result(self, temperature, evaporated_particles):
+        # Вызывается из расчетного потока: график обновляется в consume_results
+        self.results.put_point("result", temperature, evaporated_particles)
+
+        self.results_logger.log(self.current_out, temperature, evaporated_particles)
+        self.results_logger.flush()
+
+    def consume_results(self):
+        # Отрисовка накопленных результатов в потоке интерфейса
+        _, points = self.results.take()
+        if not points:
+            return
+        x = [temperature for _, temperature, _ in points]
+        y = [evaporated_particles for _, _, evaporated_particles in points]
+        self.x_values.extend(x)
+        self.y_values.extend(y)
+        self.draw_plot(x, y)
+
+    def print_sweep_progress(self, done, total):
+        sys.stdout.write("\rЗавершено экспериментов: %s из %s" % (done, total))
+        sys.stdout.flush()
+
+    def calculate_research_parallel(self):
+        # Независимые эксперименты рассчитываются в пуле процессов
+        tasks = create_evaporation_tasks(self.b_steps_quantity + 1 - self.current_out,
+                                         particles_quantity=self.particles_quantity,
+                                         a=PARTICLE_DIAMETER,
+                                         b=PARTICLE_DIAMETER,
+                                         time_step=self.time_step,
+                                         steps=self.iter_quantity,
+                                         is_coords_rand=True,
+                                         is_speeds_rand=True)
+        results = iter_sweep(tasks, self.workers, progress=self.print_sweep_progress,
+                             is_stopped=self.research_thread.is_stopped)
+        for _, (temperature, evaporated_particles) in results:
+            self.add_research_result(temperature, evaporated_particles)
+            self.current_out += 1
 
-        with open("../research.txt", mode="a") as f:
-            f.write(str(evaporated_particles) + ", " + str(self.sum_temperature) + "\n")
-        f.close()
+        self.research_thread.is_finished = True
+        self.research_thread.stop()
 
     def calculate_research(self):
+        if self.workers > 1 and self.current_step == 0:
+            self.calculate_research_parallel()
+            return
+
         # Гиперпараметры исследования
         for number in range(self.current_out, self.b_steps_quantity + 1):
-            # Создание конфигурации
-            self.config = ParticleConfiguration(self.particles_quantity,
-                                                PARTICLE_DIAMETER,
-                                                PARTICLE_DIAMETER,
-                                                self.time_step,
-                                                is_coords_rand=True,
-                                                is_speeds_rand=True)
+            # Создание конфигурации. Прерванный эксперимент продолжается
+            # с сохраненной конфигурацией
+            if self.config is None or self.current_step == 0:
+                self.config = ParticleConfiguration(self.particles_quantity,
+                                                    PARTICLE_DIAMETER,
+                                                    PARTICLE_DIAMETER,
+                                                    self.time_step,
+                                                    is_coords_rand=True,
+                                                    is_speeds_rand=True)
 
             print_text = "\rТекущий эксперимент: %s" % self.current_out
             self.research_inner_loop(print_text)
@@ -142,13 +224,48 @@ class ResearchApp(QtWidgets.QMainWindow, interface_research_app.Ui_MainWindow):
             self.research_thread.stop()
             self.research_thread.is_finished = True
 
+    def save_research_checkpoint(self):
+        if self.research_thread.is_alive():
+            print("[+] Контрольная точка сохраняется только для остановленного исследования!")
+            return
+        # Параллельный расчет (и остановка между экспериментами) не оставляет
+        # незавершенной конфигурации: сохраняются только полученные результаты
+        if self.current_step == 0:
+            self.config = None
+            self.monitor = None
+        self.consume_results()
+        # Размер журнала исследования: строки, записанные после контрольной точки,
+        # удаляются при ее загрузке
+        self.results_logger.sync()
+        log_size = os.path.getsize(RESEARCH_LOG_PATH) if os.path.exists(RESEARCH_LOG_PATH) else 0
+        state = {"current_out": self.current_out,
+                 "current_step": self.current_step,
+                 "monitor": self.monitor,
+                 "x_values": self.x_values,
+                 "y_values": self.y_values,
+                 "log_size": log_size}
+        save_checkpoint(RESEARCH_CHECKPOINT_PATH, self.config, state)
+        print("[+] Контрольная точка сохранена:", RESEARCH_CHECKPOINT_PATH)
+
+    def load_research_checkpoint(self):
+        if self.research_thread.is_alive() or not os.path.exists(RESEARCH_CHECKPOINT_PATH):
+            return
+        self.config, state = load_checkpoint(RESEARCH_CHECKPOINT_PATH)
+        self.current_out = state["current_out"]
+        self.current_step = state["current_step"]
+        self.monitor = state["monitor"]
+        self.x_values = state["x_values"]
+        self.y_values = state["y_values"]
+        self.results_logger.close()
+        truncate_to_size(RESEARCH_LOG_PATH, state["log_size"])
+        self.open_results_logger()
+        self.graphics.clear_plot()
+        self.draw_plot(self.x_values, self.y_values)
+
     def draw_plot(self, x, y, title="Зависимость скорости испарения капли от температуры"):
         self.graphics.add_dot_ax(x, y)
         self.graphics.ax.set_title(title)
         self.graphics.draw()
-        self.graphics.flush_events()
-        time.sleep(0.001)
-
 
     def keyPressEvent(self, event):
         super(ResearchApp, self).keyPressEvent(event)
@@ -163,8 +280,18 @@ class ResearchApp(QtWidgets.QMainWindow, interface_research_app.Ui_MainWindow):
             self.stop_button.click()
             self.close()
 
+        if event.modifiers() & QtCore.Qt.KeyboardModifier.ControlModifier:
+            if event.key() == QtCore.Qt.Key.Key_S:
+                self.save_research_checkpoint()
+            if event.key() == QtCore.Qt.Key.Key_O:
+                self.load_research_checkpoint()
+
     def closeEvent(self, event):
+        self.stop_calculation()
+        self.results_timer.stop()
         self.parent_object.is_research_running = False
+        # Окно закрывается сразу; журнал закрывается после завершения расчетного потока
+        self.research_thread.call_when_done(self.results_logger.close)
 
 class Interface(QtWidgets.QMainWindow, interface_main_app.Ui_MainWindow):
     """ Класс-реализация интерфейса """
@@ -218,19 +345,25 @@ class Interface(QtWidgets.QMainWindow, interface_main_app.Ui_MainWindow):
         self.is_started = False
         self.thread = StoppableThread(self.calculation)
 
-        self.average_e = 0.0
-        self.average_t = 0.0
+        # Расчетный поток публикует кадры, поток интерфейса рисует их по таймеру.
+        # Если отрисовка не успевает, устаревшие кадры пропускаются
+        self.frames = FrameQueue()
+        self.frame_timer = QtCore.QTimer(self)
+        self.frame_timer.timeout.connect(self.consume_frames)
+        self.frame_timer.start(FRAME_TIMER_INTERVAL)
 
         self.x_values_e = []
         self.y_values_e = []
 
         self.x_values_t = []
         self.y_values_t = []
-        self.counter = 0
 
         self.is_coords_random = False
         self.is_speeds_random = False
 
+        # Журнал наблюдаемых величин текущего расчета
+        self.logger = None
+
     def research_evaporation_logic(self):
         if not self.is_research_running:
             self.research_object = ResearchApp(self)
@@ -285,29 +418,70 @@ class Interface(QtWidgets.QMainWindow, interface_main_app.Ui_MainWindow):
                                          float(self.timestep_parameter_edit.text()),
                                          self.is_coords_random,
                                          self.is_speeds_random)
+        self.open_logger()
         self.draw_graph()
 
+    def open_logger(self, append=False):
+        self.close_logger()
+        parameters = {"particles_quantity": self.cfg.particles_quantity,
+                      "a": self.cfg.a,
+                      "b": self.cfg.b,
+                      "time_step": self.cfg.time_step}
+        self.logger = ObservablesLogger(OBSERVABLES_LOG_PATH, ObservableSamples.COLUMNS,
+                                        parameters, append=append)
+
+    def close_logger(self):
+        if self.logger is not None:
+            self.logger.close()
+            self.logger = None
+
     def draw_graph(self, title=""):
-        # Отрисовка
-        self.canvas.clear_plot(self.calc_b())
+        # Отрисовка: оси и ячейка не перестраиваются, обновляются только частицы
         self.canvas.plot_configuration(self.cfg.configuration, title)
-        self.canvas.draw()
-        self.canvas.flush_events()
-        time.sleep(0.001)
 
     def draw_plot1(self, x, y):
         self.graphics.add_dot_ax1(x, y)
         self.graphics.draw()
-        self.graphics.flush_events()
-        time.sleep(0.001)
 
     def draw_plot2(self, x, y):
         self.graphics.add_dot_ax2(x, y)
         self.graphics.draw()
-        self.graphics.flush_events()
-        time.sleep(0.001)
+
+    def publish_frame(self, title):
+        # Вызывается из расчетного потока: Qt-виджеты здесь не используются
+        self.frames.put_frame(Frame.from_configuration(self.cfg, title))
+
+    def consume_frames(self):
+        # Отрисовка последнего опубликованного кадра и новых точек графиков
+        frame, points = self.frames.take()
+        if frame is not None:
+            self.canvas.plot_configuration(frame.positions, frame.title)
+
+        energy_count = len(self.x_values_e)
+        temperature_count = len(self.x_values_t)
+        for name, x, y in points:
+            if name == "start_potential":
+                self.start_potential_edit.setText(str(y))
+            elif name == "energy":
+                self.x_values_e.append(x)
+                self.y_values_e.append(y)
+            elif name == "temperature":
+                self.x_values_t.append(x)
+                self.y_values_t.append(y)
+
+        # На графики передаются только новые точки
+        if energy_count < len(self.x_values_e):
+            self.graphics.add_dot_ax1(self.x_values_e[energy_count:], self.y_values_e[energy_count:])
+        if temperature_count < len(self.x_values_t):
+            self.graphics.add_dot_ax2(self.x_values_t[temperature_count:], self.y_values_t[temperature_count:])
+        if energy_count < len(self.x_values_e) or temperature_count < len(self.x_values_t):
+            self.graphics.draw_idle()
 
     def clear_graph(self):
+        self.stop_button_logic()
+        self.thread.wait()
+        self.frames.clear()
+        self.close_logger()
         self.cfg = None
         self.canvas.clear_plot(self.calc_b())
         self.is_started = False
@@ -316,13 +490,10 @@ class Interface(QtWidgets.QMainWindow, interface_main_app.Ui_MainWindow):
         self.canvas.draw()
         self.graphics.clear_plot()
         self.graphics.draw()
-        self.average_t = 0.0
-        self.average_e = 0.0
         self.x_values_e = []
         self.y_values_e = []
         self.x_values_t = []
         self.y_values_t = []
-        self.counter = 0
 
     def calc_b(self):
         b = self.cell_period_combo.currentText()
@@ -330,48 +501,75 @@ class Interface(QtWidgets.QMainWindow, interface_main_app.Ui_MainWindow):
         return b
 
     def calculation(self):
-        # Расчет параметров на новом временном шаге
-        self.cfg.calculate_next_time_step()
-
-        self.average_e += self.cfg.E
-        self.average_t += self.cfg.temperature
-        self.counter += 1
+        # Расчет блока шагов до ближайшего кадра отрисовки
+        steps_to_frame = (self.graph_interval - self.frame % self.graph_interval) % self.graph_interval + 1
+        steps_quantity = min(steps_to_frame, self.steps + 1 - self.frame)
+        samples = self.cfg.advance(steps_quantity)
+        # После испарения всех частиц блок короче запрошенного
+        steps_quantity = len(samples)
+        logger = self.logger
+        if logger is not None:
+            logger.log_columns(**{column: getattr(samples, column) for column in samples.COLUMNS})
 
         # Вывод начальной потенциальной энергии системы
         if self.frame == 0:
-            potential = str(self.cfg.Ep)
-            self.start_potential_edit.setText(potential)
+            self.frames.put_point("start_potential", 0, samples.Ep[0])
 
-        if self.frame % self.graph_interval == 0:
-            title_string = "Временной шаг: %s" % str(self.frame) +\
+        last_frame = self.frame + steps_quantity - 1
+        if last_frame % self.graph_interval == 0:
+            title_string = "Временной шаг: %s" % str(last_frame) +\
                            "; Количество частиц: %s" % str(len(self.cfg.configuration))
-            self.draw_graph(title_string)
+            self.publish_frame(title_string)
 
-            self.average_e /= self.counter
-            self.x_values_e.append(self.frame)
-            self.y_values_e.append(self.average_e)
-
-            self.draw_plot1(self.x_values_e, self.y_values_e)
-            if self.frame >= 500:
-                self.average_t /= self.counter
+            self.frames.put_point("energy", last_frame, samples.E.mean())
+            if last_frame >= 500:
+                self.frames.put_point("temperature", last_frame, samples.temperature.mean())
 
-                self.x_values_t.append(self.frame)
-                self.y_values_t.append(self.average_t)
-                self.draw_plot2(self.x_values_t, self.y_values_t)
-
-            self.average_e = 0.0
-            self.average_t = 0.0
-            self.counter = 0
-
-        self.frame += 1
+        self.frame += steps_quantity
 
         if self.frame > self.steps or len(self.cfg.configuration) == 0:
             title_string = "Временной шаг: %s" % str(self.frame) + \
                            "; Количество частиц: %s" % str(len(self.cfg.configuration))
-            self.draw_graph(title_string)
+            self.publish_frame(title_string)
             self.thread.is_finished = True
             self.thread.stop()
 
+    def save_simulation_checkpoint(self):
+        if self.thread.is_alive() or self.cfg is None:
+            print("[+] Контрольная точка сохраняется только для остановленного расчета!")
+            return
+        self.consume_frames()
+        state = {"frame": self.frame,
+                 "x_values_e": self.x_values_e,
+                 "y_values_e": self.y_values_e,
+                 "x_values_t": self.x_values_t,
+                 "y_values_t": self.y_values_t}
+        save_checkpoint(SIMULATION_CHECKPOINT_PATH, self.cfg, state)
+        print("[+] Контрольная точка сохранена:", SIMULATION_CHECKPOINT_PATH)
+
+    def load_simulation_checkpoint(self):
+        if self.thread.is_alive() or not os.path.exists(SIMULATION_CHECKPOINT_PATH):
+            return
+        cfg, state = load_checkpoint(SIMULATION_CHECKPOINT_PATH)
+        self.clear_graph()
+        self.cfg = cfg
+        self.frame = state["frame"]
+        self.x_values_e = state["x_values_e"]
+        self.y_values_e = state["y_values_e"]
+        self.x_values_t = state["x_values_t"]
+        self.y_values_t = state["y_values_t"]
+        # Строки, записанные после контрольной точки, удаляются из журнала
+        truncate_observables(OBSERVABLES_LOG_PATH, self.cfg.step_count)
+        self.open_logger(append=True)
+
+        title_string = "Временной шаг: %s" % str(self.frame) + \
+                       "; Количество частиц: %s" % str(len(self.cfg.configuration))
+        self.draw_graph(title_string)
+        if self.x_values_e:
+            self.draw_plot1(self.x_values_e, self.y_values_e)
+        if self.x_values_t:
+            self.draw_plot2(self.x_values_t, self.y_values_t)
+
     def start_button_logic(self):
         if self.cfg is not None and self.frame < self.steps:
             if not self.thread.is_started:
@@ -400,26 +598,61 @@ class Interface(QtWidgets.QMainWindow, interface_main_app.Ui_MainWindow):
             self.stop_button.click()
             self.close()
 
+        if event.modifiers() & QtCore.Qt.KeyboardModifier.ControlModifier:
+            if event.key() == QtCore.Qt.Key.Key_S:
+                self.save_simulation_checkpoint()
+            if event.key() == QtCore.Qt.Key.Key_O:
+                self.load_simulation_checkpoint()
+
+    def closeEvent(self, event):
+        self.stop_button_logic()
+        self.thread.wait()
+        self.frame_timer.stop()
+        self.close_logger()
+
 class StoppableThread(threading.Thread):
     """ Поток для вычисления переданной функции """
     def __init__(self, obj):
         """ Конструктор потока """
         super(StoppableThread, self).__init__()
-        self._stop = threading.Event()
+        self._stop_event = threading.Event()
         self.is_started = False
         self.is_finished = False
         self.object = obj
+        # Функции, вызываемые после завершения потока (см. call_when_done)
+        self._done_lock = threading.Lock()
+        self._is_done = False
+        self._done_callbacks = []
     def run(self):
         """ Запуск потока """
         self.is_started = True
-        while not self.is_stopped():
-            self.object()
+        try:
+            while not self.is_stopped():
+                self.object()
+        finally:
+            with self._done_lock:
+                self._is_done = True
+                callbacks, self._done_callbacks = self._done_callbacks, []
+            for callback in callbacks:
+                callback()
     def stop(self):
         """ Завершение потока с помощью Event """
-        self._stop.set()
+        self._stop_event.set()
     def is_stopped(self):
         """ Проверка состояния потока """
-        return self._stop.is_set()
+        return self._stop_event.is_set()
+    def wait(self):
+        """ Ожидание завершения текущего блока расчета после остановки """
+        if self.is_alive():
+            self.join()
+    def call_when_done(self, callback):
+        """ Вызов callback после завершения потока без ожидания;
+            если поток не выполняется, callback вызывается сразу """
+        with self._done_lock:
+            if self.is_alive() and not self._is_done:
+                self._done_callbacks.append(callback)
+                return
+        callback()
 
 
 def main():
@@ -1,4 +1,5 @@
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.collections import EllipseCollection
 from matplotlib.figure import Figure
 import matplotlib.pyplot as plt
 from global_variables import *
@@ -6,6 +7,65 @@ from PyQt5 import QtWidgets
 import numpy as np
 
 
+# Наибольшее число точек линии графика; при переполнении точки прореживаются
+MAX_PLOT_POINTS = 2000
+# Запас при расширении пределов осей, доля диапазона данных
+PLOT_LIMITS_MARGIN = 0.25
+
+
+class PlotLine:
+    """ Линия графика, данные которой дописываются на месте.
+        Хранится не более max_points точек: при заполнении буфера
+        остается каждая вторая точка, а новые точки берутся с удвоенным шагом """
+    def __init__(self, ax, max_points=MAX_PLOT_POINTS, **style):
+        self.ax = ax
+        self.line, = ax.plot([], [], **style)
+        # Четный размер буфера: после прореживания шаг новых точек сохраняется
+        max_points += max_points % 2
+        self.x = np.empty(max_points)
+        self.y = np.empty(max_points)
+        self.count = 0
+        self.stride = 1
+        self.received = 0
+
+    def append(self, x, y):
+        is_kept = self.received % self.stride == 0
+        self.received += 1
+        if not is_kept:
+            return
+        if self.count == len(self.x):
+            half = self.count // 2
+            self.x[:half] = self.x[:self.count:2]
+            self.y[:half] = self.y[:self.count:2]
+            self.count = half
+            self.stride *= 2
+        self.x[self.count] = x
+        self.y[self.count] = y
+        self.count += 1
+
+    def extend(self, x_values, y_values):
+        """ Добавление точек; возвращает True, если изменились пределы осей """
+        for x, y in zip(x_values, y_values):
+            self.append(x, y)
+        self.line.set_data(self.x[:self.count], self.y[:self.count])
+        return self.update_limits()
+
+    def update_limits(self):
+        # Пределы расширяются с запасом, чтобы не пересчитывать их на каждой точке
+        if self.count == 0:
+            return False
+        x, y = self.x[:self.count], self.y[:self.count]
+        x_min, x_max, y_min, y_max = x.min(), x.max(), y.min(), y.max()
+        (x_low, x_high), (y_low, y_high) = self.ax.get_xlim(), self.ax.get_ylim()
+        if self.count > 1 and x_low <= x_min and x_max <= x_high and y_low <= y_min and y_max <= y_high:
+            return False
+        x_margin = PLOT_LIMITS_MARGIN * (x_max - x_min) or 1.
+        y_margin = PLOT_LIMITS_MARGIN * (y_max - y_min) or abs(y_max) or 1.
+        self.ax.set_xlim(x_min - x_margin, x_max + x_margin)
+        self.ax.set_ylim(y_min - y_margin, y_max + y_margin)
+        return True
+
+
 class MplAnimation(FigureCanvas):
     """ Функция отрисовки """
     def __init__(self, b, dpi=100):
@@ -13,24 +73,56 @@ class MplAnimation(FigureCanvas):
 
         # Добавление области графа
         self.ax = self.fig.add_subplot(111, aspect='equal')
+        # Частицы и заголовок перерисовываются поверх сохраненного фона
+        self.particles = None
+        self.background = None
         self.clear_plot(b)
 
         # Инициализация
         FigureCanvas.__init__(self, self.fig)
         FigureCanvas.setSizePolicy(self, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding)
         FigureCanvas.updateGeometry(self)
-
-    def plot_circle(self, particle):
-        # Рисование границ ячейки
-        x, y, rad = particle.transform_world_to_screen()
-        circle = plt.Circle((x, y), rad, facecolor='white', fill=True,
-                            linewidth=0.9, antialiased=True, edgecolor="blue")
-        self.ax.add_patch(circle)
+        self.mpl_connect("draw_event", self.on_draw)
+
+    def create_particles(self):
+        # Все частицы отрисовываются одной коллекцией
+        diameter = 2 * transform_world_to_screen(PARTICLE_RADIUS)
+        self.particles = EllipseCollection([diameter], [diameter], [0.], units="xy",
+                                           offsets=np.zeros((0, 2)), transOffset=self.ax.transData,
+                                           facecolor="white", linewidth=0.9, antialiased=True,
+                                           edgecolor="blue", animated=True)
+        self.ax.add_collection(self.particles)
+        self.ax.title.set_animated(True)
+
+    def on_draw(self, event):
+        # Сохранение фона после полной перерисовки (изменение размера, масштаба)
+        self.background = self.copy_from_bbox(self.fig.bbox)
+        self.draw_animated()
+
+    def draw_animated(self):
+        self.ax.draw_artist(self.particles)
+        self.ax.draw_artist(self.ax.title)
 
     def plot_configuration(self, list_of_particles, title=""):
-        for p in list_of_particles:
-            self.plot_circle(p)
-            self.ax.set_title(title)
+        """ Обновление положений частиц без перестроения осей """
+        if isinstance(list_of_particles, np.ndarray):
+            positions = list_of_particles
+        elif hasattr(list_of_particles, "positions"):
+            positions = list_of_particles.positions
+        else:
+            positions = [(p.x, p.y) for p in list_of_particles]
+        self.particles.set_offsets(transform_world_to_screen(positions).reshape(-1, 2))
+        self.ax.set_title(title)
+        self.update_frame()
+
+    def update_frame(self):
+        """ Перерисовка частиц и заголовка поверх фона """
+        if self.background is None:
+            self.draw()
+            return
+        self.restore_region(self.background)
+        self.draw_animated()
+        self.blit(self.fig.bbox)
 
     def plot_cell(self, b):
         self.ax.set_xlim(MPL_MIN_RANGE, MPL_MAX_RANGE)
@@ -63,6 +155,8 @@ class MplAnimation(FigureCanvas):
     def clear_plot(self, b):
         self.ax.clear()
         self.plot_cell(b)
+        self.create_particles()
+        self.background = None
 
     def get_ticks(self):
         x_ticks = list(self.ax.get_xticks())
@@ -79,6 +173,7 @@ class MplGraphics(FigureCanvas):
         self.ax1 = self.fig.add_subplot(211)
         self.ax2 = self.fig.add_subplot(212)
         self.add_text()
+        self.create_lines()
 
         # Инициализация
         FigureCanvas.__init__(self, self.fig)
@@ -96,8 +191,14 @@ class MplGraphics(FigureCanvas):
         self.ax1.grid(linestyle="dotted", alpha=0.65)
         self.ax2.grid(linestyle="dotted", alpha=0.65)
 
+    def create_lines(self):
+        # Линии создаются один раз и дополняются новыми точками
+        self.line1 = PlotLine(self.ax1, linestyle="dotted", marker="o", markersize=3, color='r')
+        self.line2 = PlotLine(self.ax2, linestyle="dotted", marker="o", markersize=3, color='b')
+
     def add_dot_ax1(self, x, y):
-        self.ax1.plot(x, y, linestyle="dotted", marker="o", markersize=3, color='r')
+        """ Добавление новых точек графика энергии """
+        return self.line1.extend(x, y)
 
         # Для отчета.
         # self.ax1.autoscale(False)
@@ -105,7 +206,8 @@ class MplGraphics(FigureCanvas):
         # self.ax1.set_xlim([min(x), max(x)])
 
     def add_dot_ax2(self, x, y):
-        self.ax2.plot(x, y, linestyle="dotted", marker="o", markersize=3, color='b')
+        """ Добавление новых точек графика температуры """
+        return self.line2.extend(x, y)
 
         # Для отчета.
         # self.ax2.autoscale(False)
@@ -116,6 +218,7 @@ class MplGraphics(FigureCanvas):
         self.ax1.clear()
         self.ax2.clear()
         self.add_text()
+        self.create_lines()
 
 
 class MplResearch(FigureCanvas):
@@ -126,6 +229,7 @@ class MplResearch(FigureCanvas):
         # Добавление области графа
         self.ax = self.fig.add_subplot(111)
         self.add_text()
+        self.create_lines()
 
         # Инициализация
         FigureCanvas.__init__(self, self.fig)
@@ -139,10 +243,15 @@ class MplResearch(FigureCanvas):
 
         self.ax.grid(linestyle="dotted", alpha=0.65)
 
+    def create_lines(self):
+        self.line = PlotLine(self.ax, linestyle="None", marker="v", markersize=6,
+                             markeredgecolor='blue', markerfacecolor="None")
+
     def add_dot_ax(self, x, y):
-        self.ax.plot(x, y, linestyle="None", marker="v", markersize=6,
-                     markeredgecolor='blue', markerfacecolor="None")
+        """ Добавление новых результатов экспериментов """
+        return self.line.extend(x, y)
 
     def clear_plot(self):
         self.ax.clear()
         self.add_text()
+        self.create_lines()
@@ -0,0 +1,162 @@
+import numpy as np
+
+
+# Смещения соседних ячеек: половина окрестности Мура, чтобы каждая
+# пара соседних ячеек просматривалась ровно один раз
+HALF_STENCIL = ((0, 0), (1, 0), (-1, 1), (0, 1), (1, 1))
+
+
+class CellList:
+    """ Разбиение расчетной области на ячейки для поиска соседей """
+    def __init__(self, cutoff, l_min, l_max, periodic=False):
+        self.l_min = l_min
+        self.cells_per_side = max(1, int((l_max - l_min) // cutoff))
+        # Периодическая область: сторона для минимального образа (0 - открытая область)
+        self.box = (l_max - l_min) if periodic else 0.
+        if periodic and self.cells_per_side < 3:
+            # Окрестность ячейки не должна замыкаться сама на себя
+            self.cells_per_side = 1
+        # Размер ячейки не меньше радиуса обрезания
+        self.cell_size = (l_max - l_min) / self.cells_per_side
+
+        # Перестановка частиц, упорядочивающая их по ячейкам
+        self.order = None
+        self.cell_start = None
+        self.cell_xy = None
+
+    def build(self, positions):
+        """ Распределение частиц по ячейкам """
+        n = self.cells_per_side
+        cell_xy = np.floor((positions - self.l_min) / self.cell_size).astype(np.int64)
+        if self.box:
+            cell_xy %= n
+        else:
+            # Частицы за пределами области относятся к крайним ячейкам
+            np.clip(cell_xy, 0, n - 1, out=cell_xy)
+        cell_id = cell_xy[:, 0] * n + cell_xy[:, 1]
+
+        if self.order is not None and len(self.order) == len(positions):
+            # Частицы за шаг почти не меняют ячейки: устойчивая сортировка
+            # почти упорядоченного массива выполняется за линейное время
+            permutation = np.argsort(cell_id[self.order], kind="stable")
+            self.order = self.order[permutation]
+        else:
+            self.order = np.argsort(cell_id, kind="stable")
+
+        self.cell_start = np.searchsorted(cell_id[self.order], np.arange(n * n + 1))
+        self.cell_xy = cell_xy
+
+    def compact(self, keep_mask):
+        """ Согласование порядка частиц с удалением частиц из хранилища """
+        if self.order is None or len(self.order) != len(keep_mask):
+            self.order = None
+            return
+        new_index = np.cumsum(keep_mask) - 1
+        self.order = new_index[self.order[keep_mask[self.order]]]
+
+    def pairs(self, positions, cutoff):
+        """ Пары частиц (i, j), находящихся на расстоянии меньше cutoff.
+            Каждая неупорядоченная пара возвращается один раз """
+        n = self.cells_per_side
+        order = self.order
+        cell_xy = self.cell_xy[order]
+        sorted_index = np.arange(len(order))
+
+        pairs_i = []
+        pairs_j = []
+        stencil = HALF_STENCIL if n > 1 else HALF_STENCIL[:1]
+        for dx, dy in stencil:
+            neighbor_x = cell_xy[:, 0] + dx
+            neighbor_y = cell_xy[:, 1] + dy
+            if self.box:
+                # Соседние ячейки через периодическую границу
+                neighbor_x %= n
+                neighbor_y %= n
+                valid = np.ones(len(order), dtype=bool)
+            else:
+                valid = (neighbor_x >= 0) & (neighbor_x < n) & (neighbor_y >= 0) & (neighbor_y < n)
+            neighbor = neighbor_x[valid] * n + neighbor_y[valid]
+            first = self.cell_start[neighbor]
+            last = self.cell_start[neighbor + 1]
+            if dx == 0 and dy == 0:
+                # Внутри своей ячейки только частицы, стоящие дальше по порядку
+                first = sorted_index[valid] + 1
+
+            counts = np.maximum(last - first, 0)
+            total = counts.sum()
+            if total == 0:
+                continue
+            starts = np.cumsum(counts) - counts
+            candidates = np.arange(total) - np.repeat(starts - first, counts)
+            pairs_i.append(order[np.repeat(sorted_index[valid], counts)])
+            pairs_j.append(order[candidates])
+
+        if not pairs_i:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+
+        pairs_i = np.concatenate(pairs_i)
+        pairs_j = np.concatenate(pairs_j)
+        delta = positions[pairs_i] - positions[pairs_j]
+        if self.box:
+            delta -= self.box * np.round(delta / self.box)
+        close = delta[:, 0] ** 2 + delta[:, 1] ** 2 < cutoff ** 2
+        return pairs_i[close], pairs_j[close]
+
+
+class VerletList:
+    """ Список соседей Верле с оболочкой толщиной skin """
+    def __init__(self, cutoff, skin, cell_list):
+        self.cutoff = cutoff
+        self.skin = skin
+        self.cell_list = cell_list
+
+        self.pairs_i = None
+        self.pairs_j = None
+        # Координаты частиц на момент последнего построения
+        self.reference = None
+
+        # Статистика перестроений для подбора толщины оболочки
+        self.rebuild_count = 0
+        self.steps_since_rebuild = 0
+
+    def invalidate(self):
+        """ Принудительное перестроение при следующем обращении """
+        self.reference = None
+
+    def needs_rebuild(self, positions):
+        """ Проверка смещения частиц более чем на половину оболочки """
+        if self.reference is None or len(self.reference) != len(positions):
+            return True
+        displacement = positions - self.reference
+        box = self.cell_list.box
+        if box:
+            # Частицы, перенесенные через периодическую границу, не считаются сместившимися
+            displacement -= box * np.round(displacement / box)
+        max_displacement_2 = np.max(displacement[:, 0] ** 2 + displacement[:, 1] ** 2, initial=0.)
+        return 4 * max_displacement_2 > self.skin ** 2
+
+    def compact(self, keep_mask):
+        """ Удаление пар с частицами, для которых маска равна False,
+            и перенумерация остальных без перестроения списка """
+        self.cell_list.compact(keep_mask)
+        if self.reference is None or len(self.reference) != len(keep_mask):
+            self.reference = None
+            return
+        new_index = np.cumsum(keep_mask) - 1
+        kept = keep_mask[self.pairs_i] & keep_mask[self.pairs_j]
+        self.pairs_i = new_index[self.pairs_i[kept]]
+        self.pairs_j = new_index[self.pairs_j[kept]]
+        self.reference = self.reference[keep_mask]
+
+    def update(self, positions):
+        """ Актуальный список пар, перестраиваемый при необходимости """
+        if self.needs_rebuild(positions):
+            self.cell_list.build(positions)
+            self.pairs_i, self.pairs_j = self.cell_list.pairs(positions, self.cutoff + self.skin)
+            self.reference = positions.copy()
+            self.rebuild_count += 1
+            self.steps_since_rebuild = 0
+        else:
+            self.steps_since_rebuild += 1
+        return self.pairs_i, self.pairs_j
@@ -0,0 +1,146 @@
+""" Буферизованная запись наблюдаемых величин.
+
+Строки копятся в памяти и передаются пакетами фоновому потоку записи,
+поэтому вызовы log не ждут диска. Параметры запуска записываются
+отдельными столбцами в каждой строке, чтобы файлы разных запусков можно
+было объединять. Формат выбирается по расширению: ".parquet" (если
+установлен pyarrow) или CSV в остальных случаях.
+"""
+import numpy as np
+import threading
+import queue
+import csv
+import os
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+def truncate_observables(path, step):
+    """ Удаление строк CSV-журнала, записанных после шага контрольной точки
+        (номер шага - первый столбец). Отсутствующий или пустой файл не изменяется """
+    if not os.path.exists(path):
+        return
+    with open(path, newline="") as f:
+        rows = list(csv.reader(f))
+    if not rows:
+        return
+    kept = [rows[0]] + [row for row in rows[1:] if int(row[0]) <= step]
+    with open(path, mode="w", newline="") as f:
+        csv.writer(f).writerows(kept)
+
+
+def truncate_to_size(path, size):
+    """ Возврат журнала к размеру size байт, сохраненному в контрольной точке.
+        Используется для журналов без номера шага в строках """
+    if os.path.exists(path) and os.path.getsize(path) > size:
+        with open(path, mode="r+b") as f:
+            f.truncate(size)
+
+
+class ObservablesLogger:
+    """ Запись столбцов наблюдаемых величин в фоновом потоке """
+    def __init__(self, path, columns, parameters=None, buffer_rows=4096, append=False):
+        self.path = path
+        self.columns = tuple(columns)
+        self.parameters = dict(parameters or {})
+        self.buffer_rows = buffer_rows
+        self.is_parquet = path.endswith(".parquet")
+        if self.is_parquet and pyarrow is None:
+            raise ValueError("Для записи в формате parquet требуется pyarrow")
+        if self.is_parquet and append:
+            raise ValueError("Дозапись в файл parquet не поддерживается")
+
+        self.rows = []
+        self.batches = queue.Queue()
+        self.error = None
+        self.is_closed = False
+
+        self.file = None
+        self.writer = None
+        if not self.is_parquet:
+            is_new = not append or not os.path.exists(path) or os.path.getsize(path) == 0
+            self.file = open(path, mode="a" if append else "w", newline="")
+            self.writer = csv.writer(self.file)
+            if is_new:
+                self.writer.writerow(self.columns + tuple(self.parameters))
+
+        self.thread = threading.Thread(target=self.write_loop, daemon=True)
+        self.thread.start()
+
+    def log(self, *values):
+        """ Добавление строки со значениями в порядке columns """
+        self.rows.append(values)
+        if len(self.rows) >= self.buffer_rows:
+            self.flush()
+
+    def log_columns(self, **arrays):
+        """ Добавление нескольких строк, заданных массивами столбцов """
+        self.flush()
+        batch = [np.asarray(arrays[column]).tolist() for column in self.columns]
+        self.batches.put(list(zip(*batch)))
+
+    def flush(self):
+        """ Передача накопленных строк потоку записи """
+        if self.rows:
+            self.batches.put(self.rows)
+            self.rows = []
+
+    def sync(self):
+        """ Ожидание записи всех переданных строк (например, перед контрольной точкой) """
+        self.flush()
+        self.batches.join()
+
+    def write_loop(self):
+        parquet_writer = None
+        while True:
+            batch = self.batches.get()
+            if batch is None:
+                self.batches.task_done()
+                break
+            if self.error is None:
+                try:
+                    if self.is_parquet:
+                        parquet_writer = self.write_parquet(parquet_writer, batch)
+                    else:
+                        constants = tuple(self.parameters.values())
+                        self.writer.writerows(tuple(row) + constants for row in batch)
+                        self.file.flush()
+                except Exception as error:
+                    self.error = error
+            self.batches.task_done()
+
+        if parquet_writer is not None:
+            parquet_writer.close()
+
+    def write_parquet(self, parquet_writer, batch):
+        data = {column: [row[index] for row in batch] for index, column in enumerate(self.columns)}
+        for name, value in self.parameters.items():
+            data[name] = [value] * len(batch)
+        table = pyarrow.table(data)
+        if parquet_writer is None:
+            parquet_writer = pyarrow.parquet.ParquetWriter(self.path, table.schema)
+        parquet_writer.write_table(table)
+        return parquet_writer
+
+    def close(self):
+        """ Запись оставшихся строк и завершение потока записи """
+        if self.is_closed:
+            return
+        self.is_closed = True
+        self.flush()
+        self.batches.put(None)
+        self.thread.join()
+        if self.file is not None:
+            self.file.close()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
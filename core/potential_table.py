@@ -0,0 +1,118 @@
+""" Табличный потенциал Леннарда-Джонса с обрезанием.
+
+Потенциал пары и отношение силы к расстоянию вычисляются один раз
+на равномерной сетке по квадрату расстояния r^2 от (TABLE_MIN_RATIO * a)^2
+до R2^2 и затем линейно интерполируются. В расчете пар не остается
+корней, высоких степеней и ветвлений функции обрезания. Для редких
+сближений ближе нижней границы таблицы используется точная формула.
+Точность задается числом узлов таблицы (см. PotentialTable.max_error).
+"""
+from kernels import *
+from functools import lru_cache
+
+
+# Число узлов таблицы по умолчанию
+TABLE_POINTS = 8192
+# Нижняя граница таблицы в единицах параметра a
+TABLE_MIN_RATIO = 0.75
+
+
+class PotentialTable:
+    """ Таблица потенциала и отношения силы к расстоянию по r^2 """
+    def __init__(self, a, r0, e, r1, r2, points=TABLE_POINTS):
+        if points < 2:
+            raise ValueError("Таблица потенциала должна содержать не менее двух узлов")
+        self.a = a
+        self.r0 = r0
+        self.e = e
+        self.r1 = r1
+        self.r2 = r2
+        self.points = points
+
+        self.r2_min = (TABLE_MIN_RATIO * a) ** 2
+        self.r2_max = r2 ** 2
+        self.step = (self.r2_max - self.r2_min) / (points - 1)
+        self.inverse_step = 1. / self.step
+
+        rij_2 = self.r2_min + self.step * np.arange(points)
+        potential, ratio = pair_potential_ratio(rij_2, a, r0, e, r1, r2)
+        # Последний узел - радиус обрезания: за ним значения и наклоны равны нулю
+        potential[-1] = 0.
+        ratio[-1] = 0.
+        self.potential = potential
+        self.ratio = ratio
+        self.potential_slope = np.append(np.diff(potential), 0.)
+        self.ratio_slope = np.append(np.diff(ratio), 0.)
+
+    def lookup(self, rij_2):
+        """ Потенциалы пар и отношения сил к расстояниям по квадратам расстояний """
+        position = (rij_2 - self.r2_min) * self.inverse_step
+        close = rij_2 < self.r2_min
+        index = np.clip(position, 0, self.points - 1).astype(np.int64)
+        fraction = position - index
+        potential = self.potential[index] + fraction * self.potential_slope[index]
+        ratio = self.ratio[index] + fraction * self.ratio_slope[index]
+
+        if close.any():
+            potential[close], ratio[close] = pair_potential_ratio(rij_2[close], self.a, self.r0,
+                                                                  self.e, self.r1, self.r2)
+        return potential, ratio
+
+    def max_error(self, samples=100000):
+        """ Наибольшие относительные отклонения потенциала и отношения силы
+            к расстоянию от точной формулы на промежутке таблицы.
+            Малые значения сравниваются с масштабом глубины ямы e и e/a^2 """
+        rij_2 = np.linspace(self.r2_min, self.r2_max, samples)
+        potential, ratio = self.lookup(rij_2)
+        exact_potential, exact_ratio = pair_potential_ratio(rij_2, self.a, self.r0, self.e, self.r1, self.r2)
+        potential_error = np.abs(potential - exact_potential) / np.maximum(np.abs(exact_potential), self.e)
+        ratio_error = np.abs(ratio - exact_ratio) / np.maximum(np.abs(exact_ratio), self.e / self.a ** 2)
+        return potential_error.max(), ratio_error.max()
+
+
+@lru_cache(maxsize=8)
+def get_potential_table(a, r0, e, r1, r2, points=TABLE_POINTS):
+    """ Таблица, построенная один раз для набора параметров """
+    return PotentialTable(a, r0, e, r1, r2, points)
+
+
+def pair_interactions_table(positions, pairs_i, pairs_j, table, box=0.):
+    """ Силы и потенциальные энергии по списку пар с табличным потенциалом """
+    delta = pair_displacements(positions, pairs_i, pairs_j, box)
+    rij_2 = delta[:, 0] ** 2 + delta[:, 1] ** 2
+    potential, ratio = table.lookup(rij_2)
+    return accumulate_pairs(len(positions), pairs_i, pairs_j, delta, potential, ratio)
+
+
+def pair_interactions_table_scalar(positions, pairs_i, pairs_j, table, box=0.):
+    """ Поэлементный расчет по списку пар с табличным потенциалом """
+    particles_count = len(positions)
+    forces = np.zeros((particles_count, 2))
+    potentials = np.zeros(particles_count)
+    coords = positions.tolist()
+    for i, j in zip(pairs_i.tolist(), pairs_j.tolist()):
+        dx = coords[i][0] - coords[j][0]
+        dy = coords[i][1] - coords[j][1]
+        if box:
+            dx -= box * round(dx / box)
+            dy -= box * round(dy / box)
+        rij_2 = dx ** 2 + dy ** 2
+        if rij_2 >= table.r2_max:
+            continue
+        if rij_2 < table.r2_min:
+            potential, ratio = pair_potential_ratio(rij_2, table.a, table.r0, table.e, table.r1, table.r2)
+        else:
+            position = (rij_2 - table.r2_min) * table.inverse_step
+            index = int(position)
+            fraction = position - index
+            potential = table.potential[index] + fraction * table.potential_slope[index]
+            ratio = table.ratio[index] + fraction * table.ratio_slope[index]
+
+        potentials[i] += potential
+        potentials[j] += potential
+        forces[i, 0] += ratio * dx
+        forces[i, 1] += ratio * dy
+        forces[j, 0] -= ratio * dx
+        forces[j, 1] -= ratio * dy
+
+    return forces, potentials, 0.5 * potentials.sum()
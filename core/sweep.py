@@ -0,0 +1,97 @@
+from concurrent.futures import ProcessPoolExecutor, wait
+from global_variables import *
+from convergence import *
+import multiprocessing
+import threading
+import sys
+import os
+
+
+# Интервал проверки остановки при ожидании результатов экспериментов, с
+SWEEP_POLL_INTERVAL = 0.1
+
+
+def create_evaporation_tasks(experiments_quantity, base_seed=None, **params):
+    """ Параметры независимых экспериментов с собственными seed """
+    seeds = np.random.SeedSequence(base_seed).generate_state(experiments_quantity)
+    return [dict(params, seed=int(seed)) for seed in seeds]
+
+
+def run_evaporation_experiment(task):
+    """ Один эксперимент: средняя температура равновесного участка и число
+        испарившихся частиц. Расчет заканчивается после steps шагов, испарения
+        всех частиц или сходимости средних с точностью tolerance """
+    steps = task.get("steps", STEPS)
+    particles_quantity = task["particles_quantity"]
+    config = ParticleConfiguration(particles_quantity,
+                                   task["a"],
+                                   task["b"],
+                                   task["time_step"],
+                                   is_coords_rand=task.get("is_coords_rand", False),
+                                   is_speeds_rand=task.get("is_speeds_rand", False),
+                                   is_research_speed=task.get("is_research_speed", False),
+                                   system_temp=task.get("system_temp", 0),
+                                   boundary=task.get("boundary", "open"),
+                                   lattice=task.get("lattice", "square"),
+                                   integrator=task.get("integrator", "verlet"),
+                                   seed=task.get("seed"))
+
+    monitor = ConvergenceMonitor(len(config.store), task.get("tolerance", CONVERGENCE_TOLERANCE))
+    while not monitor.is_finished(steps):
+        monitor.update(config.advance(min(CONVERGENCE_CHECK_STEPS, steps - monitor.steps)))
+    return float(monitor.mean_temperature()), len(config.evaporated)
+
+
+def shutdown_without_waiting(executor):
+    """ Завершение пула без ожидания выполняемых экспериментов.
+        Ожидающие задачи отменяются, выполняемые дорабатывают в фоне """
+    if sys.version_info >= (3, 9):
+        executor.shutdown(wait=False, cancel_futures=True)
+    else:
+        executor.shutdown(wait=False)
+
+
+def iter_sweep(tasks, workers=None, progress=None, is_stopped=None):
+    """ Параллельный расчет экспериментов в пуле процессов.
+        Результаты (номер, результат) выдаются в порядке задач.
+        Остановка проверяется каждые SWEEP_POLL_INTERVAL секунд и не ждет
+        завершения выполняемых экспериментов """
+    workers = workers or os.cpu_count()
+    done_lock = threading.Lock()
+    done = [0]
+
+    def on_done(future):
+        if progress is None or future.cancelled():
+            return
+        with done_lock:
+            done[0] += 1
+            progress(done[0], len(tasks))
+
+    # Процессы запускаются заново, а не копируются fork из многопоточного
+    # процесса (потоки Qt и журнала наблюдаемых)
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    is_completed = False
+    try:
+        futures = [executor.submit(run_evaporation_experiment, task) for task in tasks]
+        for future in futures:
+            future.add_done_callback(on_done)
+
+        for number, future in enumerate(futures):
+            while not future.done():
+                if is_stopped is not None and is_stopped():
+                    for pending in futures[number:]:
+                        pending.cancel()
+                    return
+                wait([future], timeout=SWEEP_POLL_INTERVAL)
+            yield number, future.result()
+        is_completed = True
+    finally:
+        if is_completed:
+            executor.shutdown()
+        else:
+            shutdown_without_waiting(executor)
+
+
+def run_sweep(tasks, workers=None, progress=None):
+    """ Список результатов всех экспериментов в порядке задач """
+    return [result for _, result in iter_sweep(tasks, workers, progress)]
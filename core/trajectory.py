@@ -0,0 +1,205 @@
+""" Двоичная запись траектории и ее чтение через отображение в память.
+
+Файл состоит из заголовка HEADER_DTYPE и последовательности кадров
+одинакового размера (см. frame_dtype). Размер кадра задается начальным
+числом частиц; после испарения части частиц хвост массивов кадра
+заполняется NaN (идентификаторы - значением -1), а число оставшихся
+частиц хранится в поле "particles". Каждый кадр хранит номер шага и
+моделируемое время: при адаптивном шаге время не равно step * time_step.
+"""
+from global_variables import *
+import os
+
+
+TRAJECTORY_MAGIC = b"MDTRAJ"
+TRAJECTORY_VERSION = 2
+
+HEADER_DTYPE = np.dtype([("magic", "S6"),
+                         ("version", "<u2"),
+                         ("a", "<f8"),
+                         ("b", "<f8"),
+                         ("time_step", "<f8"),
+                         ("particles", "<i8"),
+                         ("r1", "<f8"),
+                         ("r2", "<f8"),
+                         ("cell_length", "<f8")])
+
+
+def frame_dtype(capacity):
+    """ Тип кадра траектории для заданного начального числа частиц """
+    return np.dtype([("step", "<i8"),
+                     ("time", "<f8"),
+                     ("particles", "<i8"),
+                     ("ids", "<i8", (capacity,)),
+                     ("positions", "<f8", (capacity, 2)),
+                     ("velocities", "<f8", (capacity, 2)),
+                     ("forces", "<f8", (capacity, 2))])
+
+
+def read_header(path):
+    """ Проверенный заголовок файла траектории """
+    header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+    if len(header) == 0 or header["magic"][0] != TRAJECTORY_MAGIC:
+        raise ValueError("Файл не является траекторией: %s" % path)
+    if header["version"][0] != TRAJECTORY_VERSION:
+        raise ValueError("Неподдерживаемая версия траектории: %s" % header["version"][0])
+    return header[0]
+
+
+def complete_frames_count(path, dtype):
+    """ Число полностью записанных кадров файла """
+    return (os.path.getsize(path) - HEADER_DTYPE.itemsize) // dtype.itemsize
+
+
+class TrajectoryWriter:
+    """ Запись координат, скоростей и сил каждые every шагов.
+        При append=True кадры дописываются в существующий файл: размер кадра
+        берется из его заголовка, а кадры после шага конфигурации удаляются """
+    def __init__(self, path, config, every=1, append=False):
+        self.every = every
+        self.frames_written = 0
+        # Файл создан заново (начальный кадр еще не записан)
+        self.is_new = not (append and os.path.exists(path))
+        if self.is_new:
+            self.create(path, config)
+        else:
+            self.open_existing(path, config)
+        # Буфер кадра переиспользуется при каждой записи
+        self.frame = np.zeros(1, dtype=self.dtype)
+
+    def create(self, path, config):
+        self.capacity = len(config.store)
+        self.dtype = frame_dtype(self.capacity)
+
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header["magic"] = TRAJECTORY_MAGIC
+        header["version"] = TRAJECTORY_VERSION
+        header["a"] = config.a
+        header["b"] = config.b
+        header["time_step"] = config.time_step
+        header["particles"] = self.capacity
+        header["r1"] = R1
+        header["r2"] = R2
+        header["cell_length"] = config.l_max - config.l_min
+
+        self.file = open(path, mode="wb")
+        self.file.write(header.tobytes())
+
+    def open_existing(self, path, config):
+        header = read_header(path)
+        if header["a"] != config.a or header["b"] != config.b or header["time_step"] != config.time_step:
+            raise ValueError("Траектория %s записана с другими параметрами системы" % path)
+        self.capacity = int(header["particles"])
+        self.dtype = frame_dtype(self.capacity)
+        if len(config.store) > self.capacity:
+            raise ValueError("Число частиц превышает размер кадра траектории")
+
+        # Сохраняются кадры до шага конфигурации включительно; неполный кадр отбрасывается
+        frames_count = complete_frames_count(path, self.dtype)
+        kept = 0
+        if frames_count > 0:
+            steps = np.memmap(path, dtype=self.dtype, mode="r", offset=HEADER_DTYPE.itemsize,
+                              shape=(frames_count,))["step"]
+            kept = int(np.count_nonzero(steps <= config.step_count))
+            del steps
+        self.file = open(path, mode="r+b")
+        self.file.truncate(HEADER_DTYPE.itemsize + kept * self.dtype.itemsize)
+        self.file.seek(0, os.SEEK_END)
+
+    def write(self, config):
+        """ Запись текущего состояния конфигурации """
+        store = config.store
+        count = len(store)
+        if count > self.capacity:
+            raise ValueError("Число частиц превышает размер кадра траектории")
+
+        frame = self.frame[0]
+        frame["step"] = config.step_count
+        frame["time"] = config.time
+        frame["particles"] = count
+        frame["ids"][:count] = store.ids
+        frame["ids"][count:] = -1
+        for field, values in (("positions", store.positions),
+                              ("velocities", store.velocities),
+                              ("forces", store.forces)):
+            frame[field][:count] = values
+            frame[field][count:] = np.nan
+        self.file.write(self.frame.tobytes())
+        self.frames_written += 1
+
+    def maybe_write(self, config):
+        """ Запись, если номер шага кратен every """
+        if config.step_count % self.every == 0:
+            self.write(config)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class TrajectoryReader:
+    """ Чтение траектории через отображение файла в память.
+        Кадры не загружаются целиком, срезы читаются с диска по требованию """
+    def __init__(self, path):
+        self.header = read_header(path)
+        self.a = float(self.header["a"])
+        self.b = float(self.header["b"])
+        self.time_step = float(self.header["time_step"])
+        self.capacity = int(self.header["particles"])
+        self.r1 = float(self.header["r1"])
+        self.r2 = float(self.header["r2"])
+        self.cell_length = float(self.header["cell_length"])
+
+        self.dtype = frame_dtype(self.capacity)
+        # Неполный последний кадр (запись прервана) отбрасывается
+        frames_count = complete_frames_count(path, self.dtype)
+        if frames_count > 0:
+            self.frames = np.memmap(path, dtype=self.dtype, mode="r",
+                                    offset=HEADER_DTYPE.itemsize, shape=(frames_count,))
+        else:
+            self.frames = np.zeros(0, dtype=self.dtype)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, index):
+        return self.frames[index]
+
+    @property
+    def steps(self):
+        return self.frames["step"]
+
+    @property
+    def times(self):
+        """ Моделируемое время кадров [с]; при адаптивном шаге не кратно time_step """
+        return self.frames["time"]
+
+    @property
+    def particles(self):
+        return self.frames["particles"]
+
+    def field(self, index, name):
+        """ Массив поля кадра без заполнителей испарившихся частиц """
+        frame = self.frames[index]
+        return frame[name][:frame["particles"]]
+
+    def positions(self, index):
+        return self.field(index, "positions")
+
+    def velocities(self, index):
+        return self.field(index, "velocities")
+
+    def forces(self, index):
+        return self.field(index, "forces")
+
+    def ids(self, index):
+        return self.field(index, "ids")